@@ -0,0 +1,31 @@
+import time
+from django.core.cache import caches
+
+
+class VersionCounter:
+    """
+    Version number shared by all the workers through a cache. Readers compare it
+    with the version of the data they hold, writers bump it to invalidate that data.
+    """
+    def __init__(self, cache_alias, key):
+        self.cache_alias = cache_alias
+        self.key = key
+
+    def get_cache(self):
+        return caches[self.cache_alias]
+
+    def get(self):
+        cache = self.get_cache()
+        version = cache.get(self.key)
+        if version is None:
+            # Un valore basato sul tempo evita di riusare una versione già vista dai worker
+            cache.add(self.key, int(time.time() * 1000), None)
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        cache = self.get_cache()
+        try:
+            cache.incr(self.key)
+        except ValueError:
+            cache.add(self.key, int(time.time() * 1000), None)
@@ -0,0 +1,90 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class CursorPaginator:
+    """
+    Keyset pagination: each page starts right after the last row of the previous one,
+    so the cost of a page does not depend on its depth and the table is never counted.
+    The cursor is an opaque token with the ordering values of the last returned row.
+    """
+    def __init__(self, ordering=('-id',), limit=50, max_limit=100):
+        self.ordering = ordering
+        self.limit = limit
+        self.max_limit = max_limit
+
+    def get_limit(self, limit=None):
+        if limit is None or limit == '':
+            return self.limit
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError('Limit not valid')
+        if limit < 1:
+            raise ValueError('Limit not valid')
+        return min(limit, self.max_limit)
+
+    def encode(self, item):
+        values = []
+        for field in self.ordering:
+            # Le righe possono essere istanze o dizionari (queryset con values())
+            value = item[field.lstrip('-')] if isinstance(item, dict) else getattr(item, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError, UnicodeError, AttributeError):
+            raise ValueError('Cursor not valid')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ValueError('Cursor not valid')
+        try:
+            return [self.to_python(model, field.lstrip('-'), value) for field, value in zip(self.ordering, values)]
+        except ValidationError:
+            raise ValueError('Cursor not valid')
+
+    def to_python(self, model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            # Annotazione del queryset, il valore è già del tipo corretto
+            return value
+
+    def after(self, values):
+        # (a, b) < (x, y)  =>  a < x OR (a = x AND b < y)
+        condition = Q()
+        equals = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = '%s__lt' % name if field.startswith('-') else '%s__gt' % name
+            condition |= Q(**equals, **{lookup: value})
+            equals[name] = value
+        return condition
+
+    def paginate(self, queryset, cursor=None, limit=None):
+        """
+        Return the page of items following `cursor` (the first page if the cursor
+        is empty) and the cursor of the next page, None when there are no more items.
+        """
+        limit = self.get_limit(limit)
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode(cursor, queryset.model)))
+        # Un elemento in più indica se esiste una pagina successiva
+        items = list(queryset[:limit + 1])
+        next_cursor = self.encode(items[limit - 1]) if len(items) > limit else None
+        return items[:limit], next_cursor
+
+
+def get_param(request, name):
+    # Il parametro può arrivare sia come query param sia nel body
+    value = request.query_params.get(name)
+    return value if value is not None else request.data.get(name)
+
+
+def page_data(results, next_cursor):
+    return {'results': results, 'next_cursor': next_cursor}
@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Numero massimo di destinatari per richiesta accettato da OneSignal
+MAX_PLAYER_IDS = 2000
+
+
+class PushError(Exception):
+    def __init__(self, message, retry=True):
+        super().__init__(message)
+        self.retry = retry
+
+
+class CircuitOpenError(PushError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    After `threshold` consecutive failures the circuit opens and calls fail immediately
+    for `reset_timeout` seconds; then a single call is let through to probe the provider.
+    """
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError('Circuit open')
+            self.probing = True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            return max(0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class PushClient:
+    """
+    OneSignal client: one pooled session with keep-alive shared by all the calls,
+    strict timeouts, a circuit breaker and concurrent sending of the chunks.
+    `on_request(latency, status_code, recipients, error)` is called after every HTTP call.
+    """
+    def __init__(self, api_url, app_id, api_key='', connect_timeout=3.05, read_timeout=10,
+                 pool_size=10, max_workers=4, breaker=None, on_request=None):
+        self.api_url = api_url
+        self.app_id = app_id
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_workers = max_workers
+        self.breaker = breaker or CircuitBreaker()
+        self.on_request = on_request
+        self.session = requests.Session()
+        # Nessun retry a livello di connessione: i tentativi sono gestiti dalla coda delle notifiche
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Content-Type'] = 'application/json; charset=utf-8'
+        if api_key:
+            self.session.headers['Authorization'] = 'Basic %s' % api_key
+
+    def post(self, player_ids, title, message):
+        self.breaker.before_call()
+        payload = {
+            "app_id": self.app_id,
+            "include_player_ids": player_ids,
+            "headings": {"en": title},
+            "contents": {"en": message}
+        }
+        start = time.monotonic()
+        status_code, error = None, None
+        try:
+            response = self.session.post(self.api_url, data=json.dumps(payload), timeout=self.timeout)
+            status_code = response.status_code
+            if status_code >= 400:
+                # Gli errori del server e il rate limit sono temporanei, gli altri no
+                error = PushError('HTTP %d: %s' % (status_code, response.text),
+                                  retry=status_code == 429 or status_code >= 500)
+        except requests.RequestException as e:
+            error = PushError(str(e) or e.__class__.__name__)
+        finally:
+            if self.on_request is not None:
+                self.on_request(time.monotonic() - start, status_code, len(player_ids), error)
+        if error is not None:
+            # Solo gli errori del provider aprono il circuito, non le richieste non valide
+            if error.retry:
+                self.breaker.failure()
+            else:
+                self.breaker.success()
+            raise error
+        self.breaker.success()
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    def post_many(self, calls):
+        """
+        Send the (player_ids, title, message) calls concurrently. Return, in the same
+        order, the provider answer or the PushError of each call.
+        """
+        def call(args):
+            try:
+                return self.post(*args)
+            except PushError as e:
+                return e
+
+        if len(calls) <= 1 or self.max_workers <= 1:
+            return [call(args) for args in calls]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(calls))) as executor:
+            return list(executor.map(call, calls))
+
+
+client = None
+client_lock = threading.Lock()
+
+
+def get_client():
+    # Il client (e il suo pool di connessioni) è condiviso da tutto il processo
+    global client
+    with client_lock:
+        if client is None:
+            hook = settings.PUSH_METRICS_HOOK
+            client = PushClient(
+                settings.ONESIGNAL_API_URL, settings.ONESIGNAL_APP_ID, settings.ONESIGNAL_API_KEY,
+                connect_timeout=settings.PUSH_CONNECT_TIMEOUT, read_timeout=settings.PUSH_READ_TIMEOUT,
+                pool_size=settings.PUSH_POOL_SIZE, max_workers=settings.PUSH_MAX_WORKERS,
+                breaker=CircuitBreaker(settings.PUSH_BREAKER_THRESHOLD, settings.PUSH_BREAKER_RESET),
+                on_request=import_string(hook) if isinstance(hook, str) else hook,
+            )
+        return client
@@ -0,0 +1,123 @@
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from API.storage import CONTENT_NAME
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """
+    Read-only view of `length` bytes of a file from `start`. It keeps fileno(), so
+    servers with wsgi.file_wrapper (e.g. gunicorn) send the range with sendfile,
+    starting from the current offset and stopping at Content-Length.
+    """
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) inclusive of a single `bytes=` range, None when the header
+    must be ignored (missing, malformed or with more ranges), and raise ValueError when
+    the range cannot be satisfied.
+    """
+    match = RANGE.match(header or '')
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        # bytes=-N: gli ultimi N byte
+        length = int(end)
+        if length == 0:
+            raise ValueError('Range not satisfiable')
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = size - 1 if end == '' else min(int(end), size - 1)
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def get_etag(name, stat):
+    # Per i file salvati per contenuto l'etag è lo sha256 del nome
+    match = CONTENT_NAME.match(name)
+    if match is not None:
+        return quote_etag(os.path.splitext(os.path.basename(name))[0])
+    return quote_etag('%x-%x' % (int(stat.st_mtime), stat.st_size))
+
+
+def send_file(request, name, path, cache_control):
+    """
+    Response that sends the file `path` (named `name` in the storage) after the access
+    check: the transfer is handed to the web server if MEDIA_SENDFILE is set, otherwise
+    it is a FileResponse with conditional requests and single byte ranges.
+    """
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('File not found')
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    if settings.MEDIA_SENDFILE is not None:
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_SENDFILE == 'X-Accel-Redirect':
+            # Location interna di nginx che punta a MEDIA_ROOT
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + name
+        else:
+            response['X-Sendfile'] = path
+        response['Cache-Control'] = cache_control
+        return response
+    etag = get_etag(name, stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['Cache-Control'] = cache_control
+        return response
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # Con If-Range il range vale solo se il file non è cambiato
+    if if_range is None or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % stat.st_size
+            return response
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, stat.st_size)
+        response['Content-Length'] = str(end - start + 1)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 from datetime import timedelta
 from pathlib import Path
+import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -64,6 +66,14 @@ SIMPLE_JWT = {
 if DEBUG:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Email in coda, inviate dal worker: python manage.py send_emails
+EMAIL_BATCH_SIZE = 50
+EMAIL_MAX_ATTEMPTS = 5
+# Secondi di attesa prima del secondo tentativo, raddoppiano a ogni errore
+EMAIL_RETRY_DELAY = 60
+# Secondi dopo i quali una email presa da un worker che non ha risposto torna in coda
+EMAIL_LEASE = 5 * 60
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -79,10 +89,15 @@ ROOT_URLCONF = 'API.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [BASE_DIR / 'templates']
-        ,
-        'APP_DIRS': True,
+        'DIRS': [BASE_DIR / 'templates'],
         'OPTIONS': {
+            # I template compilati restano in memoria anche con DEBUG attivo
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -105,6 +120,87 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Con più worker usare un backend condiviso (es. Redis o Memcached)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Risultati delle ricerche, con un numero massimo di elementi
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+# Cache delle card dei prodotti
+PRODUCT_CARD_CACHE = 'default'
+PRODUCT_CARD_TIMEOUT = 60 * 60 * 24
+
+# Cache dei risultati delle ricerche dei prodotti
+SEARCH_CACHE = 'search'
+SEARCH_CACHE_TIMEOUT = 60
+
+# Cache che contiene il contatore di versione di brand, colori e materiali
+TAXONOMY_CACHE = 'default'
+# Secondi dopo i quali brand, colori e materiali in memoria vengono confrontati con il database
+TAXONOMY_CHECK_INTERVAL = 5
+
+# Cache dei calendari delle prenotazioni, con Product.booking_version nella chiave: funziona anche se non è condivisa
+AVAILABILITY_CACHE = 'default'
+AVAILABILITY_TIMEOUT = 60 * 60 * 24
+
+# Notifiche push (OneSignal), inviate dal worker: python manage.py send_notifications
+# In locale si può usare il server di prova: python manage.py onesignal_stub
+ONESIGNAL_API_URL = os.environ.get('ONESIGNAL_API_URL', 'https://onesignal.com/api/v1/notifications')
+ONESIGNAL_APP_ID = os.environ.get('ONESIGNAL_APP_ID', '5eb5a37e-b458-11e3-ac11-000c2940e62c')  # Mettere id corretto
+ONESIGNAL_API_KEY = os.environ.get('ONESIGNAL_API_KEY', '')
+# Client HTTP del provider: timeout (secondi) di connessione e di lettura, connessioni e richieste in parallelo
+PUSH_CONNECT_TIMEOUT = 3.05
+PUSH_READ_TIMEOUT = 10
+PUSH_POOL_SIZE = 10
+PUSH_MAX_WORKERS = 4
+# Errori consecutivi dopo i quali il circuito si apre, e secondi prima di riprovare
+PUSH_BREAKER_THRESHOLD = 5
+PUSH_BREAKER_RESET = 30
+# Funzione (o percorso) chiamata dopo ogni richiesta con latenza, status code, destinatari ed errore
+PUSH_METRICS_HOOK = None
+NOTIFICATION_BATCH_SIZE = 200
+NOTIFICATION_MAX_ATTEMPTS = 6
+# Secondi di attesa prima del secondo tentativo, raddoppiano a ogni errore
+NOTIFICATION_RETRY_DELAY = 30
+# Secondi dopo i quali una notifica presa da un worker che non ha risposto torna in coda
+NOTIFICATION_LEASE = 5 * 60
+
+# Caricamento dei video a pezzi: cartella dei file parziali (fuori dal progetto), dimensione massima di un pezzo e del video
+UPLOAD_TEMP_DIR = os.environ.get('UPLOAD_TEMP_DIR', os.path.join(tempfile.gettempdir(), 'sisterly-uploads'))
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+# Ore dopo le quali un caricamento non completato viene eliminato (manage.py clean_uploads)
+UPLOAD_EXPIRATION = 24
+
+# Versioni ridimensionate delle immagini: lato maggiore in pixel e formati generati
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'detail': 1080,
+}
+IMAGE_VARIANT_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+# Processi che generano le versioni fuori dalla richiesta; con 0 vengono generate subito
+IMAGE_WORKERS = 2
+# Caricamento di più immagini in una richiesta: numero massimo di file e thread che li salvano
+IMAGE_UPLOAD_MAX_FILES = 12
+IMAGE_UPLOAD_WORKERS = 4
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -146,6 +242,15 @@ MEDIA_URL = '/media/'
 STATIC_ROOT = 'static'
 MEDIA_ROOT = 'media'
 
+# Invio dei media delegato al web server dopo il controllo degli accessi:
+# None (li invia Django), 'X-Accel-Redirect' (nginx) o 'X-Sendfile' (Apache, lighttpd)
+MEDIA_SENDFILE = None
+# Location "internal" di nginx con alias a MEDIA_ROOT, usata con X-Accel-Redirect
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# File caricati salvati per contenuto (sha256): duplicati salvati una sola volta e URL immutabili
+DEFAULT_FILE_STORAGE = 'API.storage.ContentAddressedStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -196,3 +301,33 @@ BAG_YEARS = [
     (1, '1-2'),
     (2, '2+')
 ]
+
+# Stati di invio delle notifiche
+DELIVERY_STATUS = [
+    (1, 'PENDING'),
+    (2, 'SENDING'),
+    (3, 'SENT'),
+    (4, 'FAILED'),
+    (5, 'NO_DEVICE'),
+]
+
+# Stati di invio delle email
+EMAIL_STATUS = [
+    (1, 'PENDING'),
+    (2, 'SENDING'),
+    (3, 'SENT'),
+    (4, 'FAILED'),
+]
+
+# Stati dei caricamenti a pezzi dei video
+UPLOAD_STATUS = [
+    (1, 'UPLOADING'),
+    (2, 'COMPLETED'),
+    (3, 'ABORTED'),
+]
+
+# Campi del nome indicizzati per la ricerca degli utenti
+NAME_FIELDS = [
+    (1, 'FIRST_NAME'),
+    (2, 'LAST_NAME'),
+]
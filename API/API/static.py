@@ -1,8 +1,11 @@
+from functools import wraps
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework import status
 from rest_framework.response import Response
-from client_app.models import Device, Product
-import requests
-import json
+from client_app.outbox import enqueue
+import hashlib
 
 
 def send_error(errors, status_error=status.HTTP_400_BAD_REQUEST):
@@ -16,15 +19,48 @@ def send_success(data=None):
     return Response(res)
 
 
+def get_validator(queryset, *fields, counts=()):
+    """
+    Cheap validator of the data behind a response: max of the given `updated_at`
+    fields and number of related rows, computed with a single aggregate query.
+    With `counts` there is no last modified date: deleting a row changes the count,
+    and so the ETag, but not the max date, so If-Modified-Since would return 304.
+    """
+    aggregates = {'version_%d' % i: Max(field) for i, field in enumerate(fields)}
+    aggregates.update({'count_%d' % i: Count(field, distinct=True) for i, field in enumerate(counts)})
+    values = queryset.aggregate(**aggregates)
+    dates = [values[key] for key in sorted(values) if key.startswith('version_') and values[key] is not None]
+    return str(sorted(values.items())), max(dates) if len(dates) > 0 and len(counts) == 0 else None
+
+
+def conditional(validator):
+    """
+    Decorator for GET views: `validator(request, **kwargs)` returns the
+    (version, last_modified) pair of the data. If the client already has that
+    version a 304 is returned before the view runs, otherwise the successful
+    response carries the ETag and Last-Modified headers.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Funziona sia con le funzioni sia con i metodi delle APIView
+            request = args[0] if hasattr(args[0], 'META') else args[1]
+            version, last_modified = validator(request, **kwargs)
+            etag = quote_etag(hashlib.md5(version.encode()).hexdigest())
+            timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                return response
+            response = func(*args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response['ETag'] = etag
+                if timestamp is not None:
+                    response['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
+
+
 def send_notification(user, title, message, many=False):
-    users_player_ids = Device.objects.filter(user=user) if not many else Device.objects.filter(user__in=user)
-    player_ids = [str(item.player_id) for item in users_player_ids]
-    if len(users_player_ids) > 0:
-        header = {"Content-Type": "application/json; charset=utf-8"}
-        payload = {
-            "app_id": "5eb5a37e-b458-11e3-ac11-000c2940e62c",  # Mettere id corretto
-            "include_player_ids": player_ids,
-            "headings": {"en": title},
-            "contents": {"en": message}
-        }
-        requests.post("https://onesignal.com/api/v1/notifications", headers=header, data=json.dumps(payload))
+    # La notifica viene messa in coda nella stessa transazione e inviata dal worker (manage.py send_notifications)
+    enqueue(user if many else [user], title, message)
@@ -0,0 +1,50 @@
+import hashlib
+import os
+import re
+from django.core.files.storage import FileSystemStorage
+
+# I file non cambiano mai a parità di nome: possono essere tenuti in cache per sempre
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# File visibili solo ad alcuni utenti: niente cache condivise (CDN, proxy)
+PRIVATE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+
+# Nome già assegnato in base al contenuto
+CONTENT_NAME = re.compile(r'^(?:[^/]+/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$')
+
+
+def content_name(name, digest):
+    # images/foto.JPG -> images/ab/cd/abcd...ef.jpg
+    directory = name.split('/')[0] if '/' in name else ''
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, digest[:2], digest[2:4], digest + extension)
+
+
+def file_digest(content):
+    digest = getattr(content, 'sha256', None)
+    if digest is not None:
+        return digest
+    sha256 = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha256.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Files are named after the sha256 of their bytes, keeping only the first directory
+    (images, video) and the extension of the name: identical files are stored once, and
+    a name always points to the same bytes, so its URL can be cached without revalidation.
+    Files may be shared by many rows, so they must never be deleted when a row is.
+    """
+    def _save(self, name, content):
+        name = content_name(name, file_digest(content))
+        if self.exists(name):
+            return name
+        # Se lo stesso file viene salvato in contemporanea, la seconda copia riceve un suffisso
+        return super()._save(name, content)
+
@@ -1,7 +1,9 @@
+import re
 from django.conf.urls.static import static
 from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
+from client_app.views.media import MediaFileView
 from django.contrib.auth import views as auth_views
 
 from rest_framework.schemas import get_schema_view
@@ -44,4 +46,8 @@ urlpatterns = [
 
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+# I media passano dal controllo degli accessi, il trasferimento può essere delegato al web server (MEDIA_SENDFILE)
+urlpatterns += [
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), MediaFileView.as_view(), name='media_file'),
+]
@@ -1,27 +1,20 @@
+from django.db import transaction
 from rest_framework import serializers
 from client_app.models import Brand, Color, Material, Issue, IssueMessage
+from client_app.taxonomy import taxonomy
 from API.static import send_notification
 
 
 def get_brand(pk):
-    try:
-        return Brand.objects.get(pk=pk)
-    except Brand.DoesNotExist:
-        return None
+    return taxonomy.get_brand(pk)
 
 
 def get_color(pk):
-    try:
-        return Color.objects.get(pk=pk)
-    except Color.DoesNotExist:
-        return None
+    return taxonomy.get_color(pk)
 
 
 def get_material(pk):
-    try:
-        return Material.objects.get(pk=pk)
-    except Material.DoesNotExist:
-        return None
+    return taxonomy.get_material(pk)
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -77,6 +70,7 @@ class IssueSerializer(serializers.ModelSerializer):
             'note': {'required': False}
         }
 
+    @transaction.atomic
     def save(self, **kwargs):
         product = kwargs.get('product')
         if product is None:
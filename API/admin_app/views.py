@@ -3,7 +3,7 @@ from API.static import send_success, send_error
 from admin_app.permissions import AdminPermission
 from admin_app.serializers import BrandSerializer, ColorSerializer, MaterialSerializer, IssueSerializer
 from client_app.models import Brand, Color, Material, Product
-from client_app.serializers.product import ProductSerializer
+from client_app.serializers.product import serialize_products
 from client_app.views.product import get_product
 
 
@@ -96,7 +96,7 @@ class ProductView(APIView):
 
     def get(self, request):
         products = Product.objects.filter(status=2)
-        return send_success([ProductSerializer(instance=item).serialize_data(admin=True) for item in products])
+        return send_success(serialize_products(products, admin=True))
 
 
 class ProductReview(APIView):
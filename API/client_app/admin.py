@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Address, Media, Image, Video, Product
+from .models import User, Address, Media, Image, Video, Product, Notification, OutgoingEmail
 
 admin.site.register(User)
 admin.site.register(Address)
@@ -7,3 +7,5 @@ admin.site.register(Media)
 admin.site.register(Image)
 admin.site.register(Video)
 admin.site.register(Product)
+admin.site.register(Notification)
+admin.site.register(OutgoingEmail)
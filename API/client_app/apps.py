@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ClientAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'client_app'
+
+    def ready(self):
+        # Registra i receiver dei segnali
+        from client_app import signals  # noqa: F401
@@ -0,0 +1,197 @@
+import bisect
+import calendar
+import datetime
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+from client_app.models import Order, Product
+
+# Stati in cui il prodotto è impegnato: in attesa di pagamento, in transito, prestato, in restituzione
+BOOKED_STATES = [2, 3, 4, 5]
+
+PRODUCT_BUSY = 'Product is being booked by another user, try again'
+
+# SQLSTATE di PostgreSQL per una riga già bloccata con nowait (lock_not_available)
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+def to_date(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+class BookingCalendar:
+    """
+    Booked periods of a product as sorted, merged and disjoint intervals of days
+    (inclusive ordinals), so every query is a binary search over the intervals.
+    """
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted((to_date(start).toordinal(), to_date(end).toordinal()) for start, end in intervals):
+            if end < start:
+                continue
+            if len(self.ends) > 0 and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def is_free(self, start, end):
+        start, end = to_date(start).toordinal(), to_date(end).toordinal()
+        # L'unico intervallo che può sovrapporsi è l'ultimo che inizia entro la fine del periodo
+        i = bisect.bisect_right(self.starts, end) - 1
+        return i < 0 or self.ends[i] < start
+
+    def booked_days(self, start, end):
+        # Giorni occupati (ordinali) compresi tra start ed end
+        start, end = to_date(start).toordinal(), to_date(end).toordinal()
+        days = set()
+        i = bisect.bisect_left(self.ends, start)
+        while i < len(self.starts) and self.starts[i] <= end:
+            days.update(range(max(self.starts[i], start), min(self.ends[i], end) + 1))
+            i += 1
+        return days
+
+    def free_days(self, year, month):
+        first = datetime.date(year, month, 1)
+        last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+        booked = self.booked_days(first, last)
+        return [day for day in range(1, last.day + 1) if first.toordinal() + day - 1 not in booked]
+
+    def next_free_window(self, start, days):
+        """
+        Return the (first, last) dates of the first window of `days` free days
+        starting on or after `start`.
+        """
+        first = to_date(start).toordinal()
+        i = bisect.bisect_left(self.ends, first)
+        while i < len(self.starts) and self.starts[i] <= first + days - 1:
+            first = max(first, self.ends[i] + 1)
+            i += 1
+        return datetime.date.fromordinal(first), datetime.date.fromordinal(first + days - 1)
+
+
+def day_bounds(start, end):
+    # Istanti che delimitano i giorni da start a end compresi
+    start = timezone.make_aware(datetime.datetime.combine(to_date(start), datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(to_date(end) + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+
+def window_availability(product_ids, start, end):
+    """
+    Availability of many products in the window [start, end] with a single grouped
+    query: the booked days of each product are OR-ed into an integer bitmap where
+    bit i is the i-th day of the window.
+    """
+    start, end = to_date(start), to_date(end)
+    days = end.toordinal() - start.toordinal() + 1
+    booked = dict.fromkeys(product_ids, 0)
+    window_start, window_end = day_bounds(start, end)
+    rows = Order.product.through.objects.filter(
+        product_id__in=booked.keys(),
+        order__state__in=BOOKED_STATES,
+        order__date_start__lt=window_end,
+        order__date_end__gte=window_start
+    ).values_list('product_id', 'order__date_start', 'order__date_end')
+    for product_id, date_start, date_end in rows:
+        first = max(to_date(date_start).toordinal() - start.toordinal(), 0)
+        last = min(to_date(date_end).toordinal() - start.toordinal(), days - 1)
+        if last >= first:
+            booked[product_id] |= ((1 << (last - first + 1)) - 1) << first
+    return [{
+        'id': product_id,
+        'free': mask == 0,
+        'days_valid': [start + datetime.timedelta(days=i) for i in range(days) if not mask >> i & 1],
+    } for product_id, mask in booked.items()]
+
+
+def get_cache():
+    return caches[settings.AVAILABILITY_CACHE]
+
+
+def calendar_key(product_id, version):
+    return 'availability:%s:%s' % (product_id, version)
+
+
+def get_calendar(product_id):
+    """
+    Return the booking calendar of a product. The cache key includes the booking
+    version read from the product row, so a calendar cached by any worker is never
+    used after a booking change, even with a cache that is not shared.
+    """
+    version = Product.objects.filter(pk=product_id).values_list('booking_version', flat=True).first()
+    key = calendar_key(product_id, version)
+    booking_calendar = get_cache().get(key)
+    if booking_calendar is None:
+        booking_calendar = BookingCalendar(
+            Order.objects.filter(product=product_id, state__in=BOOKED_STATES).values_list('date_start', 'date_end')
+        )
+        get_cache().set(key, booking_calendar, settings.AVAILABILITY_TIMEOUT)
+    return booking_calendar
+
+
+def invalidate_calendars(product_ids):
+    # Nella transazione della modifica: la nuova versione è visibile agli altri worker con il commit
+    product_ids = list(product_ids)
+    if len(product_ids) > 0:
+        Product.objects.filter(pk__in=product_ids).update(booking_version=F('booking_version') + 1)
+
+
+def is_lock_conflict(error):
+    # SQLite segnala la contesa col messaggio, PostgreSQL con il codice dell'errore originale
+    return 'database is locked' in str(error) or getattr(error.__cause__, 'pgcode', None) == LOCK_NOT_AVAILABLE
+
+
+def lock_product(product_id):
+    """
+    Lock the product row until the end of the current transaction, so the checks on
+    its bookings and the writes that follow happen as one operation. A product already
+    locked by another request is not waited for: ValueError is raised immediately.
+    """
+    try:
+        # Con SQLite select_for_update viene ignorato: la contesa arriva alla prima scrittura (booking_transaction)
+        return Product.objects.select_for_update(nowait=True).get(pk=product_id)
+    except Product.DoesNotExist:
+        raise ValueError('Product not found')
+    except OperationalError as e:
+        if not is_lock_conflict(e):
+            raise
+        raise ValueError(PRODUCT_BUSY)
+
+
+def booking_transaction(func):
+    """
+    Run `func` in a transaction and turn a lock conflict of the database (a row locked
+    with nowait, or "database is locked" on SQLite) into the same ValueError as lock_product.
+    Any other database error is raised unchanged.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except OperationalError as e:
+            if not is_lock_conflict(e):
+                raise
+            raise ValueError(PRODUCT_BUSY)
+    return wrapper
+
+
+def is_free(product_id, start, end):
+    """
+    Check the period on the bookings read from the database instead of the cached
+    calendar: to be called with the product locked by lock_product.
+    """
+    window_start, window_end = day_bounds(start, end)
+    return BookingCalendar(Order.objects.filter(
+        product=product_id,
+        state__in=BOOKED_STATES,
+        date_start__lt=window_end,
+        date_end__gte=window_start
+    ).values_list('date_start', 'date_end')).is_free(start, end)
@@ -0,0 +1,63 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import caches
+from API.counters import VersionCounter
+from client_app.models import Product
+from client_app.serializers.product import serialize_products
+
+# Cambia a ogni modifica dei prodotti e invalida i risultati delle ricerche
+catalog_generation = VersionCounter(settings.SEARCH_CACHE, 'catalog:generation')
+
+
+def get_card_cache():
+    return caches[settings.PRODUCT_CARD_CACHE]
+
+
+def card_key(pk):
+    return 'product_card:%s' % pk
+
+
+def get_product_cards(products):
+    """
+    Return the serialized cards of `products` (instances or ids) in the same order,
+    reading them from the card cache and serializing only the missing ones, in a
+    single batch.
+    """
+    products = list(products)
+    if len(products) == 0:
+        return []
+    ids = [item.pk if isinstance(item, Product) else item for item in products]
+    cache = get_card_cache()
+    cards = cache.get_many([card_key(pk) for pk in ids])
+    missing = [item for item in products if card_key(item.pk if isinstance(item, Product) else item) not in cards]
+    if len(missing) > 0:
+        if not isinstance(missing[0], Product):
+            missing = Product.objects.filter(pk__in=missing)
+        new_cards = {card_key(card['id']): card for card in serialize_products(missing)}
+        cache.set_many(new_cards, settings.PRODUCT_CARD_TIMEOUT)
+        cards.update(new_cards)
+    # I prodotti eliminati nel frattempo non hanno una card
+    return [cards[card_key(pk)] for pk in ids if card_key(pk) in cards]
+
+
+def invalidate_product_cards(product_ids):
+    keys = [card_key(pk) for pk in product_ids]
+    if len(keys) > 0:
+        get_card_cache().delete_many(keys)
+
+
+def get_search_results(query, search):
+    """
+    Return the results of `search()` for the canonical `query` from the search
+    cache, running it only on a miss. The key includes the catalog generation, so
+    any product change makes every cached result unreachable.
+    """
+    digest = hashlib.md5(json.dumps(query, sort_keys=True).encode()).hexdigest()
+    key = 'search:%s:%s' % (catalog_generation.get(), digest)
+    cache = caches[settings.SEARCH_CACHE]
+    results = cache.get(key)
+    if results is None:
+        results = search()
+        cache.set(key, results, settings.SEARCH_CACHE_TIMEOUT)
+    return results
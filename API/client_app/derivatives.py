@@ -0,0 +1,106 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image as PILImage, ImageOps
+from client_app.cache import invalidate_product_cards
+from client_app.media_access import register_files, variant_names
+from client_app.models import Image, Product
+
+logger = logging.getLogger(__name__)
+
+
+def variant_path(name, variant, extension):
+    directory, filename = os.path.split(name)
+    return os.path.join(directory, 'variants', '%s_%s.%s' % (os.path.splitext(filename)[0], variant, extension))
+
+
+def render_variants(name):
+    """
+    Build every size of IMAGE_VARIANTS in every format of IMAGE_VARIANT_FORMATS from
+    the original image and save them in the storage. Runs in the worker processes.
+    """
+    with default_storage.open(name, 'rb') as original:
+        source = PILImage.open(original)
+        source.load()
+    # Le foto dei telefoni sono spesso ruotate solo tramite i metadati EXIF
+    source = ImageOps.exif_transpose(source)
+    if source.mode != 'RGB':
+        background = PILImage.new('RGB', source.size, (255, 255, 255))
+        background.paste(source, mask=source.convert('RGBA').getchannel('A'))
+        source = background
+    variants = {}
+    # Dalla più grande alla più piccola, così ogni versione parte dalla precedente
+    for variant, size in sorted(settings.IMAGE_VARIANTS.items(), key=lambda item: -item[1]):
+        source = source.copy()
+        source.thumbnail((size, size), PILImage.LANCZOS)
+        variants[variant] = {'width': source.width, 'height': source.height}
+        for extension, options in settings.IMAGE_VARIANT_FORMATS.items():
+            data = io.BytesIO()
+            source.save(data, **options)
+            # Con lo storage per contenuto il nome è solo indicativo: conta cartella ed estensione
+            variants[variant][extension] = default_storage.save(variant_path(name, variant, extension),
+                                                                ContentFile(data.getvalue()))
+    return variants
+
+
+def store_variants(image_id, name, variants):
+    # L'immagine potrebbe essere stata sostituita nel frattempo; updated_at cambia l'ETag di prodotto e media
+    Image.objects.filter(pk=image_id, image=name).update(variants=variants, updated_at=timezone.now())
+    for media_id in Image.objects.filter(pk=image_id).values_list('media_id', flat=True):
+        register_files(media_id, variant_names(variants))
+    invalidate_product_cards(Product.objects.filter(media__image=image_id).values_list('pk', flat=True))
+
+
+pool = None
+pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Processi avviati con spawn: il fork di un processo web con più thread non è sicuro
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+        return pool
+
+
+def variants_done(image_id, name, future):
+    try:
+        store_variants(image_id, name, future.result())
+    except Exception:
+        logger.exception('Image variants of %s not built', name)
+    finally:
+        # La callback gira in un thread del pool, che non deve tenere aperta la connessione
+        connection.close()
+
+
+def build_variants(image):
+    """
+    Build the variants of an image after the current transaction is committed:
+    in the process pool or, with IMAGE_WORKERS = 0, immediately.
+    """
+    image_id, name = image.pk, image.image.name
+
+    def submit():
+        if settings.IMAGE_WORKERS == 0:
+            try:
+                store_variants(image_id, name, render_variants(name))
+            except Exception:
+                logger.exception('Image variants of %s not built', name)
+            return
+        future = get_pool().submit(render_variants, name)
+        future.add_done_callback(partial(variants_done, image_id, name))
+
+    transaction.on_commit(submit)
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from client_app.cache import invalidate_product_cards
+from client_app.derivatives import build_variants
+from client_app.media_access import register_files
+from client_app.models import Image, Product, upload_img
+
+
+def save_images(media, files, orders):
+    """
+    Add many images to a media: the files are written to the storage concurrently
+    and the rows are created with a single bulk_create.
+    """
+    with ThreadPoolExecutor(max_workers=min(settings.IMAGE_UPLOAD_WORKERS, len(files))) as executor:
+        names = list(executor.map(lambda file: default_storage.save(upload_img(None, file.name), file), files))
+    with transaction.atomic():
+        last_pk = Image.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        images = Image.objects.bulk_create([Image(media=media, image=name, order=order) for name, order in zip(names, orders)])
+        if any(image.pk is None for image in images):
+            # Database che non restituiscono le chiavi con bulk_create (es. SQLite): le righe appena create sono
+            # le ultime inserite, anche se lo storage per contenuto dà lo stesso nome alle immagini già presenti
+            created = Image.objects.filter(media=media, image__in=names, pk__gt=last_pk).order_by('-pk')[:len(images)]
+            images = sorted(created, key=lambda image: image.pk)
+        # bulk_create non invia post_save: stessi effetti dei receiver di Image
+        register_files(media.pk, names)
+        invalidate_product_cards(Product.objects.filter(media=media).values_list('pk', flat=True))
+        for image in images:
+            build_variants(image)
+    return images
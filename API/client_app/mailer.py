@@ -0,0 +1,88 @@
+import datetime
+import smtplib
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from client_app.models import OutgoingEmail
+
+# Stati delle email (settings.EMAIL_STATUS)
+PENDING = 1
+SENDING = 2
+SENT = 3
+FAILED = 4
+
+
+def enqueue_email(subject, body, to):
+    """
+    Add an already rendered email to the queue; it is sent by the send_emails worker.
+    """
+    return OutgoingEmail.objects.create(subject=subject, body=body, to=to)
+
+
+def claim(batch_size=None):
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[PENDING, SENDING], next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size or settings.EMAIL_BATCH_SIZE]
+        )
+        lease = now + datetime.timedelta(seconds=settings.EMAIL_LEASE)
+        OutgoingEmail.objects.filter(pk__in=[row.pk for row in rows]).update(status=SENDING, next_attempt_at=lease)
+    # Le istanze restituite devono avere lo stesso stato delle righe
+    for row in rows:
+        row.status = SENDING
+        row.next_attempt_at = lease
+    return rows
+
+
+def deliver(rows):
+    """
+    Send the claimed emails over a single connection to the mail server.
+    Return the number of rows per final state.
+    """
+    result = {SENT: 0, PENDING: 0, FAILED: 0}
+    connection = get_connection()
+    sent, retried = [], []
+    try:
+        connection.open()
+        for row in rows:
+            message = EmailMessage(row.subject, row.body, to=[row.to], connection=connection)
+            try:
+                connection.send_messages([message])
+            except (smtplib.SMTPException, OSError) as e:
+                row.attempts += 1
+                row.error = (str(e) or e.__class__.__name__)[:500]
+                # I destinatari rifiutati non vengono accettati neanche ai tentativi successivi
+                if not isinstance(e, smtplib.SMTPRecipientsRefused) and row.attempts < settings.EMAIL_MAX_ATTEMPTS:
+                    row.status = PENDING
+                    row.next_attempt_at = timezone.now() + datetime.timedelta(
+                        seconds=settings.EMAIL_RETRY_DELAY * 2 ** (row.attempts - 1))
+                else:
+                    row.status = FAILED
+                retried.append(row)
+                # Dopo un errore la connessione potrebbe non essere più utilizzabile
+                connection.close()
+                connection.open()
+            else:
+                row.status = SENT
+                sent.append(row)
+    except (smtplib.SMTPException, OSError) as e:
+        # Server non raggiungibile: le email non ancora gestite tornano in coda
+        handled = {row.pk for row in sent + retried}
+        for row in rows:
+            if row.pk not in handled:
+                row.attempts += 1
+                row.error = (str(e) or e.__class__.__name__)[:500]
+                row.status = PENDING if row.attempts < settings.EMAIL_MAX_ATTEMPTS else FAILED
+                row.next_attempt_at = timezone.now() + datetime.timedelta(
+                    seconds=settings.EMAIL_RETRY_DELAY * 2 ** (row.attempts - 1))
+                retried.append(row)
+    finally:
+        connection.close()
+    OutgoingEmail.objects.filter(pk__in=[row.pk for row in sent]).update(status=SENT, sent_at=timezone.now(), error='')
+    OutgoingEmail.objects.bulk_update(retried, ['status', 'attempts', 'error', 'next_attempt_at'])
+    for row in rows:
+        result[row.status] += 1
+    return result
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from client_app.derivatives import get_pool, render_variants, store_variants
+from client_app.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Build the resized versions (IMAGE_VARIANTS) of the images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild also the images that already have them')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        images = Image.objects.exclude(image='').order_by('pk')
+        if not options['all']:
+            images = images.filter(variants={})
+        items = list(images.values_list('pk', 'image'))
+        built, failed = 0, 0
+        for i in range(0, len(items), options['batch_size']):
+            batch = items[i:i + options['batch_size']]
+            names = [name for pk, name in batch]
+            if settings.IMAGE_WORKERS == 0:
+                futures = [None] * len(batch)
+            else:
+                futures = [get_pool().submit(render_variants, name) for name in names]
+            for (pk, name), future in zip(batch, futures):
+                try:
+                    variants = render_variants(name) if future is None else future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write('%s: %s' % (name, e))
+                    continue
+                store_variants(pk, name, variants)
+                built += 1
+        self.stdout.write('%d images built, %d failed' % (built, failed))
@@ -0,0 +1,116 @@
+import datetime
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from client_app.name_index import index_users, search_users
+from client_app.models import User, Address, Brand, Color, Material, Media, Image, Video, Product, Favorite, Order, MediaFile
+
+# Righe che indicano una lettura completa della tabella
+FULL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)(?!SUBQUERY)'),
+    'postgresql': re.compile(r'\bSeq Scan on\b'),
+    'mysql': re.compile(r'\btype\W+ALL\b'),
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the queries of the hot endpoints against seeded data and fail on full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1000, help='Number of products to seed before the check')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in FULL_SCAN:
+            raise CommandError('Database vendor %s not supported' % connection.vendor)
+        failures = []
+        # I dati di prova vengono eliminati con il rollback alla fine del controllo
+        try:
+            with transaction.atomic():
+                user = self.seed(options['seed'])
+                for name, queryset in self.get_queries(user):
+                    plan = queryset.explain()
+                    full_scan = FULL_SCAN[connection.vendor].search(plan) is not None
+                    if full_scan:
+                        failures.append(name)
+                        self.stdout.write(self.style.ERROR('FULL SCAN %s' % name))
+                    else:
+                        self.stdout.write(self.style.SUCCESS('OK        %s' % name))
+                    if full_scan or options['verbosity'] > 1:
+                        self.stdout.write(plan)
+                raise Rollback
+        except Rollback:
+            pass
+        if len(failures) > 0:
+            raise CommandError('%d queries fall back to a full scan: %s' % (len(failures), ', '.join(failures)))
+
+    def seed(self, size):
+        user = User.objects.create_user(email='query-plan@sisterly.local', password='query-plan',
+                                        first_name='Query', last_name='Plan')
+        address = Address.objects.create(user=user, name='Query plan', address1='-', country='IT',
+                                         province='-', city='-', zip='-')
+        brand = Brand.objects.create(name='Query plan')
+        color = Color.objects.create(color='Query plan')
+        material = Material.objects.create(material='Query plan')
+        Media.objects.bulk_create([Media(user=user) for _ in range(size)])
+        medias = list(Media.objects.filter(user=user))
+        Image.objects.bulk_create([Image(media=media, image='query-plan.jpg', order=1) for media in medias])
+        Video.objects.bulk_create([Video(media=media, video='query-plan.mp4', order=1) for media in medias])
+        MediaFile.objects.bulk_create([MediaFile(media=media, name='query-plan-%d.jpg' % media.pk) for media in medias])
+        Product.objects.bulk_create([
+            Product(owner=user, media=media, model='Query plan %d' % i, brand=brand, color=color,
+                    material=material, conditions=1, year=1, size=1, status=i % 5 + 1,
+                    delivery_type=1, delivery_kit=address)
+            for i, media in enumerate(medias)
+        ])
+        products = list(Product.objects.filter(owner=user))
+        # Altri utenti con indirizzi e preferiti, perché le tabelle non siano banali per il planner
+        User.objects.bulk_create([
+            User(email='query-plan-%d@sisterly.local' % i, first_name='Query', last_name='Plan')
+            for i in range(size // 10)
+        ])
+        users = list(User.objects.filter(email__startswith='query-plan-'))
+        index_users(users)
+        Address.objects.bulk_create([
+            Address(user=item, name='Query plan', address1='-', country='IT', province='-', city='-', zip='-')
+            for item in users
+        ])
+        Favorite.objects.bulk_create([Favorite(user=item) for item in users + [user]])
+        Favorite.products.through.objects.bulk_create([
+            Favorite.products.through(favorite=favorite, product=products[i % len(products)])
+            for i, favorite in enumerate(Favorite.objects.filter(user__email__startswith='query-plan'))
+        ])
+        now = timezone.now()
+        for i, product in enumerate(products[::10]):
+            order = Order.objects.create(user=user, lender=user, state=i % 6 + 1, date_start=now + datetime.timedelta(days=i),
+                                         date_end=now + datetime.timedelta(days=i + 3), delivery_mode=1)
+            order.product.add(product)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return user
+
+    def get_queries(self, user):
+        product = Product.objects.filter(owner=user).first()
+        media_ids = list(Media.objects.filter(user=user).values_list('pk', flat=True)[:50])
+        now = timezone.now()
+        return [
+            ('catalog', Product.objects.filter(status=4).order_by('-id')[:50]),
+            ('catalog cursor', Product.objects.filter(status=4, id__lt=product.pk + 500).order_by('-id')[:51]),
+            ('my products', Product.objects.filter(owner=user, status__lt=5)),
+            ('user products', Product.objects.filter(owner=user, status=4).order_by('-id')[:51]),
+            ('favorites', Product.objects.filter(favorite__user=user)),
+            ('media images', Image.objects.filter(media_id__in=media_ids, active=True).order_by('order', 'pk')),
+            ('media videos', Video.objects.filter(media_id__in=media_ids, active=True).order_by('order', 'pk')),
+            ('order overlap', Order.objects.filter(product=product, state=4, date_start__lte=now, date_end__gte=now)),
+            ('addresses', Address.objects.filter(user=user)),
+            ('media file access', MediaFile.objects.filter(name='query-plan-%d.jpg' % product.media_id)
+                .values_list('media__user_id', 'media__product__status')),
+            ('offer inbox', Order.objects.filter(lender=user, state=1).order_by('-id')[:51]),
+            ('order history', Order.objects.filter(user=user).order_by('-id')[:51]),
+            ('order history by state', Order.objects.filter(user=user, state=2).order_by('-id')[:51]),
+            ('user search', search_users('plan', 'que').order_by('score', 'user_id')[:21]),
+        ]
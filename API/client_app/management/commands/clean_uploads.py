@@ -0,0 +1,23 @@
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from client_app.models import VideoUpload
+from client_app.uploads import abort_upload, UPLOADING
+
+
+class Command(BaseCommand):
+    help = 'Abort the video uploads not completed within UPLOAD_EXPIRATION hours and delete their partial files'
+
+    def handle(self, *args, **options):
+        expiration = timezone.now() - datetime.timedelta(hours=settings.UPLOAD_EXPIRATION)
+        uploads = VideoUpload.objects.filter(status=UPLOADING, updated_at__lt=expiration)
+        count = 0
+        for upload in uploads.iterator():
+            try:
+                abort_upload(upload)
+            except ValueError:
+                # Completato nel frattempo
+                continue
+            count += 1
+        self.stdout.write('%d uploads aborted' % count)
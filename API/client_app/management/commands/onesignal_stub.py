@@ -0,0 +1,66 @@
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+
+# Numero massimo di destinatari per richiesta accettato da OneSignal
+MAX_PLAYER_IDS = 2000
+
+
+class Command(BaseCommand):
+    help = 'Run a local HTTP server that answers like the OneSignal notifications API, to test the worker offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--fail-rate', type=float, default=0, help='Fraction of requests answered with HTTP 503')
+        parser.add_argument('--delay', type=float, default=0, help='Seconds to wait before each answer')
+
+    def handle(self, *args, **options):
+        command = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                time.sleep(options['delay'])
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                except ValueError:
+                    return self.answer(400, {'errors': ['Invalid JSON']})
+                errors = []
+                if not payload.get('app_id'):
+                    errors.append('app_id not passed')
+                player_ids = payload.get('include_player_ids')
+                if not isinstance(player_ids, list) or len(player_ids) == 0:
+                    errors.append('include_player_ids not passed')
+                elif len(player_ids) > MAX_PLAYER_IDS:
+                    errors.append('include_player_ids must have at most %d elements' % MAX_PLAYER_IDS)
+                if not payload.get('contents'):
+                    errors.append('contents not passed')
+                if len(errors) > 0:
+                    return self.answer(400, {'errors': errors})
+                if random.random() < options['fail_rate']:
+                    return self.answer(503, {'errors': ['Service unavailable']})
+                command.stdout.write('%d recipients: %s' % (len(player_ids), payload['contents'].get('en')))
+                self.answer(200, {'id': str(uuid.uuid4()), 'recipients': len(player_ids)})
+
+            def answer(self, code, data):
+                body = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write('OneSignal stub on http://%s:%d/api/v1/notifications' % (options['host'], options['port']))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
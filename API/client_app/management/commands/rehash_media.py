@@ -0,0 +1,50 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from API.storage import CONTENT_NAME
+from client_app.media_access import register_files, variant_names
+from client_app.models import Image, Video
+
+
+class Command(BaseCommand):
+    help = 'Move the images and videos saved before the content addressed storage to their content name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Delete the old files once moved')
+
+    def handle(self, *args, **options):
+        moved = {}
+        for model, field in [(Image, 'image'), (Video, 'video')]:
+            for pk, media_id, name in model.objects.exclude(**{field: ''}).values_list('pk', 'media_id', field).iterator():
+                new_name = self.rehash(name, moved)
+                if new_name is not None and new_name != name:
+                    model.objects.filter(pk=pk).update(**{field: new_name})
+                    register_files(media_id, [new_name])
+        for image in Image.objects.exclude(variants={}).only('pk', 'media_id', 'variants').iterator():
+            changed = False
+            for data in image.variants.values():
+                for key, value in data.items():
+                    if isinstance(value, str):
+                        new_name = self.rehash(value, moved)
+                        if new_name is not None and new_name != value:
+                            data[key] = new_name
+                            changed = True
+            if changed:
+                Image.objects.filter(pk=image.pk).update(variants=image.variants)
+                register_files(image.media_id, variant_names(image.variants))
+        if options['delete']:
+            for name, new_name in moved.items():
+                if new_name is not None and new_name != name:
+                    default_storage.delete(name)
+        self.stdout.write('%d files moved' % len([name for name, new_name in moved.items() if new_name not in [None, name]]))
+
+    def rehash(self, name, moved):
+        if CONTENT_NAME.match(name):
+            return name
+        if name not in moved:
+            try:
+                with default_storage.open(name, 'rb') as file:
+                    moved[name] = default_storage.save(name, file)
+            except FileNotFoundError:
+                self.stderr.write('%s not found' % name)
+                moved[name] = None
+        return moved[name]
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from client_app.outbox import claim, deliver, SENT, PENDING, FAILED, NO_DEVICE
+
+
+class Command(BaseCommand):
+    help = 'Send the queued push notifications to OneSignal, retrying the failed ones with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when there are no more due notifications')
+        parser.add_argument('--batch-size', type=int, default=None, help='Notifications taken at each iteration')
+        parser.add_argument('--sleep', type=float, default=2, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                rows = claim(options['batch_size'])
+                if len(rows) == 0:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                result = deliver(rows)
+                self.stdout.write('%d sent, %d to retry, %d failed, %d without devices' % (
+                    result[SENT], result[PENDING], result[FAILED], result[NO_DEVICE]))
+        except KeyboardInterrupt:
+            # Le notifiche prese e non completate tornano in coda alla scadenza del lease
+            pass
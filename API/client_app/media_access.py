@@ -0,0 +1,27 @@
+from client_app.models import MediaFile
+
+
+def variant_names(variants):
+    # Percorsi contenuti in Image.variants: {nome: {formato: percorso, 'width': .., 'height': ..}}
+    return [value for data in variants.values() for value in data.values() if isinstance(value, str)]
+
+
+def register_files(media_id, names):
+    names = {name for name in names if name}
+    MediaFile.objects.bulk_create([MediaFile(media_id=media_id, name=name) for name in names], ignore_conflicts=True)
+
+
+def get_access(user, name):
+    """
+    Return None if the file is not used by any media, otherwise the tuple (readable, public):
+    the files of the published products are public, the others are readable only by
+    the owner of a media that uses them and by the admins.
+    """
+    rows = list(MediaFile.objects.filter(name=name).values_list('media__user_id', 'media__product__status'))
+    if len(rows) == 0:
+        return None
+    public = any(status == 4 for user_id, status in rows)
+    # Stesso controllo di admin_app.permissions.AdminPermission: gli admin verificano i prodotti in revisione
+    if public or (user.is_authenticated and (user.is_admin or user.is_superuser) and user.is_active):
+        return True, public
+    return user.is_authenticated and any(user_id == user.pk for user_id, status in rows), False
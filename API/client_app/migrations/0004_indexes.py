@@ -0,0 +1,33 @@
+# Generated by Django 3.2.4 on 2026-10-18 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0003_auto_20210729_2046'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['media', 'active', 'order'], name='image_media_active_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['state', 'date_start', 'date_end'], name='order_state_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-id'], name='product_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['owner', 'status'], name='product_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['media', 'active', 'order'], name='video_media_active_order_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+from client_app import search_index
+
+
+def create_search_index(apps, schema_editor):
+    if not search_index.create_index(schema_editor):
+        return
+    Product = apps.get_model('client_app', 'Product')
+    products = Product.objects.using(schema_editor.connection.alias).select_related('brand').iterator()
+    rows = []
+    for item in products:
+        rows.append((item.pk, item.model, item.description, item.brand.name))
+        if len(rows) == 1000:
+            search_index.write_rows(rows, schema_editor.connection)
+            rows = []
+    search_index.write_rows(rows, schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search_index.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0004_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.4 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'brand', 'color', 'material', 'size', 'conditions'], name='product_facets_idx'),
+        ),
+    ]
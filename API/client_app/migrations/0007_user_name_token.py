@@ -0,0 +1,29 @@
+# Generated by Django 3.2.4 on 2026-10-18 10:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0006_product_facets_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNameToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.PositiveSmallIntegerField(choices=[(1, 'FIRST_NAME'), (2, 'LAST_NAME')])),
+                ('suffix', models.CharField(max_length=150)),
+                ('offset', models.PositiveSmallIntegerField(verbose_name='Posizione del suffisso nella parola')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='usernametoken',
+            index=models.Index(fields=['field', 'suffix'], name='user_name_token_suffix_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from client_app.name_index import build_tokens
+
+
+def index_user_names(apps, schema_editor):
+    User = apps.get_model('client_app', 'User')
+    UserNameToken = apps.get_model('client_app', 'UserNameToken')
+    db_alias = schema_editor.connection.alias
+    tokens = []
+    for user in User.objects.using(db_alias).only('pk', 'first_name', 'last_name').iterator():
+        tokens += [
+            UserNameToken(user_id=user_id, field=field, suffix=suffix, offset=offset)
+            for user_id, field, suffix, offset in build_tokens(user.pk, user.first_name, user.last_name)
+        ]
+        if len(tokens) >= 1000:
+            UserNameToken.objects.using(db_alias).bulk_create(tokens)
+            tokens = []
+    UserNameToken.objects.using(db_alias).bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0007_user_name_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_user_names, migrations.RunPython.noop),
+    ]
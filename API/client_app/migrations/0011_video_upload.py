@@ -0,0 +1,32 @@
+# Generated by Django 3.2.4 on 2026-10-18 10:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0010_outgoing_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255)),
+                ('order', models.IntegerField(default=0, verbose_name='Ordine di apparizione')),
+                ('size', models.BigIntegerField(verbose_name='Dimensione del file in byte')),
+                ('sha256', models.CharField(max_length=64)),
+                ('received', models.BigIntegerField(default=0, verbose_name='Byte ricevuti')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'UPLOADING'), (2, 'COMPLETED'), (3, 'ABORTED')], default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('media', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='client_app.media')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('video', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='client_app.video')),
+            ],
+        ),
+    ]
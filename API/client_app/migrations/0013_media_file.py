@@ -0,0 +1,26 @@
+# Generated by Django 3.2.4 on 2026-10-18 10:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0012_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('media', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='client_app.media')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='mediafile',
+            constraint=models.UniqueConstraint(fields=('name', 'media'), name='media_file_name_media_uniq'),
+        ),
+    ]
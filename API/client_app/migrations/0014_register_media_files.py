@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from client_app.media_access import variant_names
+
+
+def register_media_files(apps, schema_editor):
+    Image = apps.get_model('client_app', 'Image')
+    Video = apps.get_model('client_app', 'Video')
+    MediaFile = apps.get_model('client_app', 'MediaFile')
+    db_alias = schema_editor.connection.alias
+    files = set()
+    for media_id, name, variants in Image.objects.using(db_alias).values_list('media_id', 'image', 'variants').iterator():
+        files.update((media_id, item) for item in [name] + variant_names(variants or {}) if item)
+    for media_id, name in Video.objects.using(db_alias).values_list('media_id', 'video').iterator():
+        if name:
+            files.add((media_id, name))
+    MediaFile.objects.using(db_alias).bulk_create(
+        [MediaFile(media_id=media_id, name=name) for media_id, name in files], batch_size=1000, ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0013_media_file'),
+    ]
+
+    operations = [
+        migrations.RunPython(register_media_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.4 on 2026-10-18 10:58
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_favorites(apps, schema_editor):
+    Product = apps.get_model('client_app', 'Product')
+    Favorite = apps.get_model('client_app', 'Favorite')
+    db_alias = schema_editor.connection.alias
+    favorites = (Favorite.products.through.objects.using(db_alias).filter(product_id=OuterRef('pk'))
+                 .order_by().values('product_id').annotate(total=Count('pk')).values('total'))
+    Product.objects.using(db_alias).update(
+        favorite_count=Coalesce(Subquery(favorites, output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0014_register_media_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Numero di utenti che hanno il prodotto nei preferiti'),
+        ),
+        migrations.RunPython(count_favorites, migrations.RunPython.noop),
+    ]
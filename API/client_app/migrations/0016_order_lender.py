@@ -0,0 +1,33 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def set_lenders(apps, schema_editor):
+    Order = apps.get_model('client_app', 'Order')
+    db_alias = schema_editor.connection.alias
+    owners = Order.product.through.objects.using(db_alias).filter(order_id=OuterRef('pk')).values('product__owner_id')[:1]
+    Order.objects.using(db_alias).update(lender=Subquery(owners))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0015_product_favorite_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='lender',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='lent_orders', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['lender', 'state', '-id'], name='order_lender_state_idx'),
+        ),
+        migrations.RunPython(set_lenders, migrations.RunPython.noop),
+    ]
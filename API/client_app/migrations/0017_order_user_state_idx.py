@@ -0,0 +1,17 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0016_order_lender'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'state', '-id'], name='order_user_state_idx'),
+        ),
+    ]
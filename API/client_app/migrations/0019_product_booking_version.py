@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0018_order_user_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='booking_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Versione delle prenotazioni'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client_app', '0019_product_booking_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outgoingemail',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'PENDING'), (2, 'SENDING'), (3, 'SENT'), (4, 'FAILED')], default=1),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.core.validators import FileExtensionValidator
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from rest_framework.authtoken.models import Token
 from django_countries.fields import CountryField
@@ -8,12 +9,13 @@ from API import settings
 from client_app.managers import CustomUserManager
 
 
+# Lo storage (API.storage.ContentAddressedStorage) rinomina i file con lo sha256 del contenuto
 def upload_img(instance, filename):
-    return "images/%s/%s" % (instance.pk, filename)
+    return "images/%s" % filename
 
 
 def upload_video(instance, filename):
-    return "video/%s/%s" % (instance.pk, filename)
+    return "video/%s" % filename
 
 
 class User(AbstractUser):
@@ -34,6 +36,22 @@ class User(AbstractUser):
         return self.email
 
 
+class UserNameToken(models.Model):
+    # Suffissi normalizzati delle parole di nome e cognome, per la ricerca per prefisso e infisso
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    field = models.PositiveSmallIntegerField(choices=settings.NAME_FIELDS)
+    suffix = models.CharField(max_length=150)
+    offset = models.PositiveSmallIntegerField('Posizione del suffisso nella parola')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['field', 'suffix'], name='user_name_token_suffix_idx'),
+        ]
+
+    def __str__(self):
+        return self.suffix
+
+
 class Device(models.Model):
     user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
     player_id = models.CharField(max_length=50, unique=True)
@@ -45,6 +63,50 @@ class Device(models.Model):
         return str(self.user)
 
 
+class Notification(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    title = models.CharField(max_length=100)
+    message = models.TextField()
+    status = models.PositiveSmallIntegerField(choices=settings.DELIVERY_STATUS, default=1)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True)
+    error = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Notifiche da inviare, in ordine di scadenza
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.user)
+
+
+class OutgoingEmail(models.Model):
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.PositiveSmallIntegerField(choices=settings.EMAIL_STATUS, default=1)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True)
+    error = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Email da inviare, in ordine di scadenza
+            models.Index(fields=['status', 'next_attempt_at'], name='outgoing_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return self.to
+
+
 class Address(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField("name address", max_length=100)
@@ -105,11 +167,18 @@ class Media(models.Model):
 class Image(models.Model):
     media = models.ForeignKey(Media, on_delete=models.CASCADE)
     image = models.ImageField(upload_to=upload_img)
+    # Percorsi delle versioni ridimensionate: {nome: {formato: percorso}} (vedi IMAGE_VARIANTS)
+    variants = models.JSONField(default=dict, blank=True)
     active = models.BooleanField(default=True)
     order = models.IntegerField('Ordine di apparizione', default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['media', 'active', 'order'], name='image_media_active_order_idx'),
+        ]
+
     def __str__(self):
         return self.image.name
 
@@ -122,10 +191,46 @@ class Video(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['media', 'active', 'order'], name='video_media_active_order_idx'),
+        ]
+
     def __str__(self):
         return self.video.name
 
 
+class MediaFile(models.Model):
+    # File dello storage usati da un media (originali e versioni ridimensionate), per il controllo degli accessi
+    media = models.ForeignKey(Media, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'media'], name='media_file_name_media_uniq'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class VideoUpload(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    media = models.ForeignKey(Media, on_delete=models.CASCADE)
+    video = models.ForeignKey(Video, on_delete=models.SET_NULL, null=True)
+    filename = models.CharField(max_length=255)
+    order = models.IntegerField('Ordine di apparizione', default=0)
+    size = models.BigIntegerField('Dimensione del file in byte')
+    sha256 = models.CharField(max_length=64)
+    received = models.BigIntegerField('Byte ricevuti', default=0)
+    status = models.PositiveSmallIntegerField(choices=settings.UPLOAD_STATUS, default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.filename
+
+
 class Product(models.Model):
     owner = models.ForeignKey(User, on_delete=models.DO_NOTHING)
     media = models.ForeignKey(Media, on_delete=models.DO_NOTHING, null=True)
@@ -146,12 +251,37 @@ class Product(models.Model):
     delivery_kit = models.ForeignKey(Address, on_delete=models.DO_NOTHING)
     kit_payed = models.BooleanField('Indica se è stato pagato il kit', default=False)
 
+    # Aggiornato solo con F() quando cambiano i preferiti (signals.favorite_products_changed)
+    favorite_count = models.PositiveIntegerField('Numero di utenti che hanno il prodotto nei preferiti', default=0)
+    # Cambia a ogni modifica delle prenotazioni (availability.invalidate_calendars) ed entra nella chiave dei calendari
+    booking_version = models.PositiveIntegerField('Versione delle prenotazioni', default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Catalogo pubblico
+            models.Index(fields=['status', '-id'], name='product_status_id_idx'),
+            # Prodotti dell'utente
+            models.Index(fields=['owner', 'status'], name='product_owner_status_idx'),
+            # Conteggi per brand, colore, materiale, dimensione e condizioni letti solo dall'indice
+            models.Index(fields=['status', 'brand', 'color', 'material', 'size', 'conditions'], name='product_facets_idx'),
+        ]
+
     def __str__(self):
         return str(self.pk)
 
+    # Campi aggiornati solo con F(), mai dal salvataggio dell'istanza
+    COUNTER_FIELDS = ['favorite_count', 'booking_version']
+
+    def save(self, *args, **kwargs):
+        # Un'istanza letta prima di una modifica dei preferiti o delle prenotazioni non deve sovrascrivere i contatori
+        if not self._state.adding and self.pk is not None and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
 
 class Issue(models.Model):
     product = models.ForeignKey(Product, on_delete=models.DO_NOTHING)
@@ -186,6 +316,8 @@ class Favorite(models.Model):
 class Order(models.Model):
     product = models.ManyToManyField(Product)
     user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+    # Proprietario dei prodotti dell'ordine, copiato alla creazione per leggere le offerte ricevute senza join
+    lender = models.ForeignKey(User, on_delete=models.DO_NOTHING, null=True, related_name='lent_orders')
     state = models.PositiveSmallIntegerField(choices=settings.ORDER_STATUS, default=1)
     price = models.IntegerField('Prezzo proposto', default=0)
     date_start = models.DateTimeField('Data di inizio del prestito')
@@ -196,6 +328,18 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Ordini sovrapposti a un periodo (il prodotto è filtrato dalla tabella della ManyToMany)
+            models.Index(fields=['state', 'date_start', 'date_end'], name='order_state_dates_idx'),
+            # Offerte ricevute dal proprietario, in ordine di arrivo
+            models.Index(fields=['lender', 'state', '-id'], name='order_lender_state_idx'),
+            # Storico e carrello di chi richiede il prestito
+            models.Index(fields=['user', 'state', '-id'], name='order_user_state_idx'),
+            # Storico senza filtro sullo stato, già nell'ordine della pagina
+            models.Index(fields=['user', '-id'], name='order_user_id_idx'),
+        ]
+
     def __str__(self):
         return str(self.pk)
 
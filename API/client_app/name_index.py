@@ -0,0 +1,72 @@
+from django.db.models import Case, F, IntegerField, Max, Min, Q, Value, When
+from client_app.models import UserNameToken
+from client_app.search_index import tokenize
+
+FIRST_NAME = 1
+LAST_NAME = 2
+# Lunghezza massima di UserNameToken.suffix
+MAX_SUFFIX_LENGTH = 150
+# Limite superiore per la ricerca per prefisso sull'indice (suffix >= termine AND suffix < termine + MAX_CHAR)
+MAX_CHAR = '\U0010ffff'
+# Parole più corte corrispondono a una parte troppo grande dell'indice e vengono ignorate
+MIN_TERM_LENGTH = 3
+
+
+def build_tokens(user_id, first_name, last_name):
+    """
+    Return the (user_id, field, suffix, offset) rows of a user: every suffix of
+    every normalized word of the name, so an infix search is a prefix search on
+    the suffixes and can use the index.
+    """
+    rows = []
+    for field, name in [(FIRST_NAME, first_name), (LAST_NAME, last_name)]:
+        for word in tokenize(name):
+            word = word[:MAX_SUFFIX_LENGTH]
+            rows += [(user_id, field, word[offset:], offset) for offset in range(len(word))]
+    return rows
+
+
+def index_users(users):
+    users = list(users)
+    UserNameToken.objects.filter(user__in=users).delete()
+    rows = []
+    for user in users:
+        rows += build_tokens(user.pk, user.first_name, user.last_name)
+    UserNameToken.objects.bulk_create([
+        UserNameToken(user_id=user_id, field=field, suffix=suffix, offset=offset) for user_id, field, suffix, offset in rows
+    ])
+
+
+def search_users(first_name=None, last_name=None):
+    """
+    Return a queryset of {user_id, score} of the users whose first and last names
+    contain every given word, ranked by score: 0 for an exact word, 1 for a prefix
+    and 2 for an infix, summed over the words. Words shorter than MIN_TERM_LENGTH
+    are ignored; ValueError is raised if only such words are given.
+    """
+    terms = [(FIRST_NAME, word) for word in tokenize(first_name)] + [(LAST_NAME, word) for word in tokenize(last_name)]
+    if len(terms) == 0:
+        return None
+    terms = [(field, word) for field, word in terms if len(word) >= MIN_TERM_LENGTH]
+    if len(terms) == 0:
+        raise ValueError('Search at least %d characters' % MIN_TERM_LENGTH)
+    conditions = [Q(field=field, suffix__gte=word, suffix__lt=word + MAX_CHAR) for field, word in terms]
+    annotations = {}
+    for i, ((field, word), condition) in enumerate(zip(terms, conditions)):
+        annotations['match_%d' % i] = Max(Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        annotations['rank_%d' % i] = Min(Case(
+            When(condition & Q(offset=0, suffix=word), then=Value(0)),
+            When(condition & Q(offset=0), then=Value(1)),
+            When(condition, then=Value(2)),
+            default=Value(3),
+            output_field=IntegerField()
+        ))
+    condition = conditions[0]
+    score = F('rank_0')
+    for i in range(1, len(terms)):
+        condition |= conditions[i]
+        score = score + F('rank_%d' % i)
+    # Ogni parola cercata deve corrispondere ad almeno un suffisso dell'utente
+    return UserNameToken.objects.filter(condition).values('user_id').annotate(**annotations).filter(
+        **{'match_%d' % i: 1 for i in range(len(terms))}
+    ).annotate(score=score)
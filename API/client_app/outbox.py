@@ -0,0 +1,100 @@
+import datetime
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from API.push import get_client, CircuitOpenError, MAX_PLAYER_IDS
+from client_app.models import Device, Notification
+
+# Stati di consegna (settings.DELIVERY_STATUS)
+PENDING = 1
+SENDING = 2
+SENT = 3
+FAILED = 4
+NO_DEVICE = 5
+
+
+def enqueue(users, title, message):
+    """
+    Add a notification for each user to the outbox. The rows are written in the
+    current transaction, so they are committed (or discarded) with the change they notify.
+    """
+    return Notification.objects.bulk_create([
+        Notification(user_id=getattr(user, 'pk', user), title=title, message=message) for user in users
+    ])
+
+
+def claim(batch_size=None):
+    """
+    Take the due notifications and mark them as being sent. A notification that is not
+    completed within NOTIFICATION_LEASE seconds (e.g. the worker died) becomes due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[PENDING, SENDING], next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size or settings.NOTIFICATION_BATCH_SIZE]
+        )
+        lease = now + datetime.timedelta(seconds=settings.NOTIFICATION_LEASE)
+        Notification.objects.filter(pk__in=[row.pk for row in rows]).update(status=SENDING, next_attempt_at=lease)
+    return rows
+
+
+def deliver(rows):
+    """
+    Send the claimed notifications: rows with the same title and message are merged into
+    a single request with all their recipients. Return the number of rows per final state.
+    """
+    result = {SENT: 0, PENDING: 0, FAILED: 0, NO_DEVICE: 0}
+    players = {}
+    for user_id, player_id in Device.objects.filter(user_id__in={row.user_id for row in rows}).values_list('user_id', 'player_id'):
+        players.setdefault(user_id, []).append(str(player_id))
+    groups = {}
+    for row in rows:
+        if row.user_id in players:
+            groups.setdefault((row.title, row.message), []).append(row)
+        else:
+            row.status = NO_DEVICE
+    Notification.objects.filter(pk__in=[row.pk for row in rows if row.status == NO_DEVICE]).update(status=NO_DEVICE)
+    # Le righe sono divise in richieste con al massimo MAX_PLAYER_IDS destinatari, inviate in parallelo
+    chunks = []
+    for (title, message), items in groups.items():
+        chunk, player_ids = [], set()
+        for row in items:
+            if len(chunk) > 0 and len(player_ids) + len(players[row.user_id]) > MAX_PLAYER_IDS:
+                chunks.append((chunk, (sorted(player_ids), title, message)))
+                chunk, player_ids = [], set()
+            chunk.append(row)
+            player_ids.update(players[row.user_id])
+        chunks.append((chunk, (sorted(player_ids), title, message)))
+    client = get_client()
+    results = client.post_many([call for chunk, call in chunks])
+    now = timezone.now()
+    sent, retried = [], []
+    for (chunk, call), error in zip(chunks, results):
+        if not isinstance(error, Exception):
+            sent += chunk
+            continue
+        for row in chunk:
+            row.error = str(error)[:500]
+            if isinstance(error, CircuitOpenError):
+                # Il provider non è stato chiamato: non conta come tentativo
+                row.status = PENDING
+                row.next_attempt_at = now + datetime.timedelta(seconds=client.breaker.retry_after())
+                continue
+            row.attempts += 1
+            if error.retry and row.attempts < settings.NOTIFICATION_MAX_ATTEMPTS:
+                # Backoff esponenziale tra i tentativi
+                row.status = PENDING
+                row.next_attempt_at = now + datetime.timedelta(
+                    seconds=settings.NOTIFICATION_RETRY_DELAY * 2 ** (row.attempts - 1))
+            else:
+                row.status = FAILED
+        retried += chunk
+    for row in sent:
+        row.status = SENT
+    Notification.objects.filter(pk__in=[row.pk for row in sent]).update(status=SENT, sent_at=now, error='')
+    Notification.objects.bulk_update(retried, ['status', 'attempts', 'error', 'next_attempt_at'])
+    for row in rows:
+        result[row.status] += 1
+    return result
@@ -0,0 +1,139 @@
+import re
+import unicodedata
+from django.db import connection, OperationalError
+from django.db.models.expressions import RawSQL
+
+TABLE = 'client_app_product_search'
+# Indica se la tabella dell'indice esiste, calcolato al primo utilizzo
+available = None
+
+
+def normalize(text):
+    # Minuscolo e senza accenti, così la ricerca è indipendente da entrambi
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def tokenize(text):
+    return re.findall(r'\w+', normalize(text))
+
+
+def create_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(model, description, brand, tokenize='unicode61')" % TABLE
+            )
+        except OperationalError:
+            # SQLite compilato senza FTS5: la ricerca usa il fallback su LIKE
+            return False
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE IF NOT EXISTS %s (product_id bigint PRIMARY KEY, document tsvector NOT NULL)' % TABLE
+        )
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS %s_document_idx ON %s USING GIN (document)' % (TABLE, TABLE))
+    else:
+        return False
+    return True
+
+
+def drop_index(schema_editor):
+    if schema_editor.connection.vendor in ['sqlite', 'postgresql']:
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % TABLE)
+
+
+def is_available():
+    global available
+    if available is None:
+        available = connection.vendor in ['sqlite', 'postgresql'] and TABLE in connection.introspection.table_names()
+    return available
+
+
+def write_rows(rows, conn=connection):
+    """
+    Insert or replace the documents of the given (product_id, model, description, brand) rows.
+    """
+    rows = [(pk, normalize(model), normalize(description), normalize(brand)) for pk, model, description, brand in rows]
+    if len(rows) == 0:
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % TABLE, [(row[0],) for row in rows])
+            cursor.executemany('INSERT INTO %s (rowid, model, description, brand) VALUES (%%s, %%s, %%s, %%s)' % TABLE, rows)
+        else:
+            # Il modello e il brand pesano più della descrizione
+            cursor.executemany(
+                "INSERT INTO %s (product_id, document) VALUES (%%s, "
+                "setweight(to_tsvector('simple', %%s), 'A') || setweight(to_tsvector('simple', %%s), 'C') || "
+                "setweight(to_tsvector('simple', %%s), 'B')) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document" % TABLE,
+                rows
+            )
+
+
+def index_products(products):
+    if not is_available():
+        return
+    write_rows([(item.pk, item.model, item.description, item.brand.name) for item in products])
+
+
+def remove_products(product_ids):
+    if not is_available():
+        return
+    column = 'rowid' if connection.vendor == 'sqlite' else 'product_id'
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM %s WHERE %s = %%s' % (TABLE, column), [(pk,) for pk in product_ids])
+
+
+def text_query(tokens):
+    # Ogni parola come prefisso, tutte obbligatorie
+    if connection.vendor == 'sqlite':
+        return ' AND '.join('"%s"*' % token for token in tokens)
+    return ' & '.join('%s:*' % token for token in tokens)
+
+
+def matching(term):
+    """
+    Return a subquery of the ids of all the products matching `term`, without ranking
+    or limit, to be used as `pk__in`. None if the index is not available or `term` has no words.
+    """
+    tokens = tokenize(term)
+    if not is_available() or len(tokens) == 0:
+        return None
+    if connection.vendor == 'sqlite':
+        return RawSQL('SELECT rowid FROM %s WHERE %s MATCH %%s' % (TABLE, TABLE), [text_query(tokens)])
+    return RawSQL("SELECT product_id FROM %s WHERE document @@ to_tsquery('simple', %%s)" % TABLE, [text_query(tokens)])
+
+
+def match(term, limit, products=None):
+    """
+    Return the ids of the products matching every word of `term` (as a prefix),
+    sorted by relevance. With `products` (a queryset) only its rows are searched, so
+    `limit` applies after the filters. None if the index is not available on this database.
+    """
+    if not is_available():
+        return None
+    tokens = tokenize(term)
+    if len(tokens) == 0:
+        return []
+    column = 'rowid' if connection.vendor == 'sqlite' else 'product_id'
+    condition, params = '', []
+    if products is not None:
+        # Stato e filtri dei prodotti nella stessa query dell'indice, prima del LIMIT
+        sql, params = products.order_by().values('pk').query.sql_with_params()
+        condition = ' AND %s IN (%s)' % (column, sql)
+    query = text_query(tokens)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                'SELECT rowid FROM %s WHERE %s MATCH %%s%s ORDER BY bm25(%s, 10.0, 1.0, 5.0) LIMIT %%s' % (TABLE, TABLE, condition, TABLE),
+                [query, *params, limit]
+            )
+        else:
+            cursor.execute(
+                "SELECT product_id FROM %s WHERE document @@ to_tsquery('simple', %%s)%s "
+                "ORDER BY ts_rank(document, to_tsquery('simple', %%s)) DESC, product_id DESC LIMIT %%s" % (TABLE, condition),
+                [query, *params, query, limit]
+            )
+        return [row[0] for row in cursor.fetchall()]
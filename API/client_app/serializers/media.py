@@ -1,5 +1,10 @@
+import os
+import re
+from django.conf import settings
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from client_app.models import Image, Video, Media
+from client_app.models import Image, Video, Media, VideoUpload
+from client_app.uploads import create_upload
 
 
 class MediaSerializer(serializers.ModelSerializer):
@@ -9,9 +14,11 @@ class MediaSerializer(serializers.ModelSerializer):
 
 
 class ImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Image
-        fields = ['id', 'image', 'order']
+        fields = ['id', 'image', 'order', 'variants']
         extra_kwargs = {
             'id': {'required': False},
             'order': {'required': True},
@@ -26,6 +33,33 @@ class ImageSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+    def get_variants(self, instance):
+        # Le versioni sono vuote finché non sono state generate: si usa l'originale
+        variants = {}
+        for variant, data in instance.variants.items():
+            variants[variant] = {
+                key: default_storage.url(value) if key in settings.IMAGE_VARIANT_FORMATS else value
+                for key, value in data.items()
+            }
+        return variants
+
+
+class ImageBatchSerializer(serializers.Serializer):
+    images = serializers.ListField(child=serializers.ImageField(), min_length=1,
+                                   max_length=settings.IMAGE_UPLOAD_MAX_FILES)
+    orders = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        fields = ['images', 'orders']
+
+    def validate(self, data):
+        # Senza ordini le immagini seguono l'ordine dei file
+        orders = data.get('orders', list(range(1, len(data['images']) + 1)))
+        if len(orders) != len(data['images']):
+            raise serializers.ValidationError('One order for each image is needed')
+        data['orders'] = orders
+        return data
+
 
 class VideoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -44,3 +78,35 @@ class VideoSerializer(serializers.ModelSerializer):
         instance.video = self.validated_data['video']
         instance.save()
         return instance
+
+
+class VideoUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VideoUpload
+        fields = ['id', 'filename', 'size', 'sha256', 'order', 'received', 'status']
+        read_only_fields = ['id', 'received', 'status']
+
+    def validate_filename(self, value):
+        # Stesse estensioni accettate dal campo video
+        value = os.path.basename(value)
+        extensions = Video._meta.get_field('video').validators[0].allowed_extensions
+        if os.path.splitext(value)[1][1:].lower() not in [extension.lower() for extension in extensions]:
+            raise serializers.ValidationError('File extension not allowed')
+        return value
+
+    def validate_size(self, value):
+        if value < 1 or value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError('Size not valid')
+        return value
+
+    def validate_sha256(self, value):
+        if re.fullmatch(r'[0-9a-fA-F]{64}', value) is None:
+            raise serializers.ValidationError('Checksum not valid')
+        return value
+
+    def save(self, **kwargs):
+        user = kwargs.get('user')
+        media = kwargs.get('media')
+        if user is None or media is None:
+            raise ValueError('User or media not passed')
+        return create_upload(user, media, **self.validated_data)
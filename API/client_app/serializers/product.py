@@ -1,10 +1,14 @@
-import calendar
 import datetime
+from django.db import transaction
+from django.db.models import QuerySet, prefetch_related_objects
+from django.utils import timezone
 from rest_framework import serializers
 from API.settings import PRODUCT_STATES, BAG_SIZE, BAG_YEARS, BAG_CONDITIONS, DELIVERY_TYPE, ORDER_STATUS
 from admin_app.serializers import BrandSerializer, ColorSerializer, MaterialSerializer
 from client_app.serializers.media import ImageSerializer, VideoSerializer
-from client_app.models import Product, Media, Brand, Color, Material, Image, Video, Favorite, Address, Order
+from client_app.models import Product, Media, Image, Video, Favorite, Address, Order
+from client_app.taxonomy import taxonomy
+from client_app.availability import get_calendar, window_availability, lock_product, is_free, day_bounds, booking_transaction
 from API.static import send_notification
 
 MAPPING_PRODUCTS = [
@@ -15,6 +19,14 @@ MAPPING_PRODUCTS = [
     ('delivery_kit_pk', 'delivery_kit')
 ]
 
+# Scelte indicizzate per valore: DELIVERY_TYPE contiene anche 12 (FACE_TO_FACE_OR_RIDER)
+ORDER_STATES = {item[0]: item for item in ORDER_STATUS}
+DELIVERY_MODES = {item[0]: item for item in DELIVERY_TYPE}
+
+# Limiti della ricerca di disponibilità su più prodotti
+MAX_AVAILABILITY_PRODUCTS = 500
+MAX_AVAILABILITY_DAYS = 92
+
 
 def user_product(product_id, user):
     if user is None:
@@ -29,23 +41,22 @@ def user_product(product_id, user):
 
 
 def get_data(validated_data, user):
-    data = {}
     try:
-        data['media'] = Media.objects.get(pk=validated_data['media_pk'])
-        data['brand'] = Brand.objects.get(pk=validated_data['brand_pk'])
-        data['color'] = Color.objects.get(pk=validated_data['color_pk'])
-        data['material'] = Material.objects.get(pk=validated_data['material_pk'])
-        data['delivery_kit'] = Address.objects.get(pk=validated_data['delivery_kit_pk'], user=user)
-    except (Media.DoesNotExist, Brand.DoesNotExist, Color.DoesNotExist, Material.DoesNotExist, Address.DoesNotExist):
+        data = {
+            'media': Media.objects.get(pk=validated_data['media_pk']),
+            'delivery_kit': Address.objects.get(pk=validated_data['delivery_kit_pk'], user=user),
+        }
+    except (Media.DoesNotExist, Address.DoesNotExist):
+        data = {'media': None}
+    # Brand, colori e materiali sono letti dal registro in memoria
+    data['brand'] = taxonomy.get_brand(validated_data['brand_pk'])
+    data['color'] = taxonomy.get_color(validated_data['color_pk'])
+    data['material'] = taxonomy.get_material(validated_data['material_pk'])
+    if None in data.values():
         raise ValueError('One (or more) of media, brand, color, material, address does not exist')
     return data
 
 
-def order_submit_valid(product, date_start):
-    filter_order = Order.objects.filter(product=product, date_start__lte=date_start, date_end__gte=date_start, state=4)
-    return len(filter_order) == 0
-
-
 class AddProductSerializer(serializers.ModelSerializer):
     media_pk = serializers.IntegerField(min_value=1)
     brand_pk = serializers.IntegerField(min_value=1)
@@ -55,13 +66,13 @@ class AddProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ['id', 'model', 'media_pk', 'brand_pk', 'color_pk', 'material_pk', 'conditions', 'year', 'size', 'description', 'price_retail', 'price_offer', 'delivery_type']
+        fields = ['id', 'model', 'media_pk', 'brand_pk', 'color_pk', 'material_pk', 'delivery_kit_pk', 'conditions', 'year', 'size', 'description', 'price_retail', 'price_offer', 'delivery_type']
         extra_kwargs = {
             'id': {'required': False},
             'description': {'required': False},
             'price_retail': {'required': True, 'min_value': 0},
             'price_offer': {'required': True, 'min_value': 0},
-            'delivery_type': {'required': True, 'min_value': 1},
+            'delivery_type': {'required': True},
         }
 
     def save(self, **kwargs):
@@ -75,7 +86,7 @@ class AddProductSerializer(serializers.ModelSerializer):
         return Product.objects.create(**self.validated_data, owner=user)
 
     def update(self, instance, validated_data):
-        objects_data = get_data(validated_data)
+        objects_data = get_data(validated_data, instance.owner)
         instance.media = objects_data['media']
         instance.brand = objects_data['brand']
         instance.color = objects_data['color']
@@ -96,47 +107,65 @@ class ProductSerializer(serializers.ModelSerializer):
     def serialize_data(self, admin=False):
         if not self.instance:
             return {}
-        images = Image.objects.filter(media=self.instance.media, active=True)
-        videos = Video.objects.filter(media=self.instance.media, active=True)
-        data = {
-            'id': self.instance.pk,
-            'model': self.instance.model,
-            'media': {
-                'images': ImageSerializer(instance=images, many=True).data,
-                'videos': VideoSerializer(instance=videos, many=True).data
-            },
-            'brand': BrandSerializer(instance=self.instance.brand).data,
-            'color': ColorSerializer(instance=self.instance.color).data,
-            'material': MaterialSerializer(instance=self.instance.material).data,
-            'conditions': BAG_CONDITIONS[self.instance.conditions - 1],
-            'year': BAG_YEARS[self.instance.year - 1],
-            'size': BAG_SIZE[self.instance.size - 1],
-            'price_retail': self.instance.price_retail,
-            'price_offer': self.instance.proce_offer,
-            'status': PRODUCT_STATES[self.instance.status - 1],
-            'delivery_type': DELIVERY_TYPE[self.instance.delivery_type - 1 if self.instance.delivery_type != 12 else 2]
+        return serialize_products([self.instance], admin)[0]
+
+
+# Immagini e video attivi raggruppati per media: una query per le immagini e una per i video
+def get_media_data(media_ids):
+    media_data = {pk: {'images': [], 'videos': []} for pk in media_ids}
+    if len(media_data) == 0:
+        return media_data
+    images = Image.objects.filter(media_id__in=media_data.keys(), active=True).order_by('order', 'pk')
+    videos = Video.objects.filter(media_id__in=media_data.keys(), active=True).order_by('order', 'pk')
+    for item in images:
+        media_data[item.media_id]['images'].append(ImageSerializer(instance=item).data)
+    for item in videos:
+        media_data[item.media_id]['videos'].append(VideoSerializer(instance=item).data)
+    return media_data
+
+
+# Serializza una lista (o un queryset) di prodotti con un numero fisso di query
+def serialize_products(products, admin=False):
+    if isinstance(products, QuerySet):
+        products = list(products.select_related('brand', 'color', 'material'))
+    else:
+        products = list(products)
+        prefetch_related_objects(products, 'brand', 'color', 'material')
+    media_data = get_media_data({item.media_id for item in products if item.media_id is not None})
+    data = []
+    for item in products:
+        media = media_data.get(item.media_id, {'images': [], 'videos': []})
+        product = {
+            'id': item.pk,
+            'model': item.model,
+            'media': media,
+            'brand': BrandSerializer(instance=item.brand).data,
+            'color': ColorSerializer(instance=item.color).data,
+            'material': MaterialSerializer(instance=item.material).data,
+            'conditions': BAG_CONDITIONS[item.conditions - 1],
+            'year': BAG_YEARS[item.year - 1],
+            'size': BAG_SIZE[item.size - 1],
+            'price_retail': item.price_retail,
+            'price_offer': item.price_offer,
+            'status': PRODUCT_STATES[item.status - 1],
+            'favorite_count': item.favorite_count,
+            'delivery_type': DELIVERY_TYPE[item.delivery_type - 1 if item.delivery_type != 12 else 2]
         }
         if admin:
-            data['media_verify'] = VideoSerializer(instance=self.instance.media_verify).data
-        return data
+            # Il video di verifica viene salvato nel media del prodotto
+            product['media_verify'] = media['videos']
+        data.append(product)
+    return data
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Order
-        fields = ['product', 'state', 'price', 'date_start', 'date_end', 'delivery_mode']
-
-    def serialize_data(self):
-        if not self.instance:
-            return {}
-        return {
-            'product': ProductSerializer(instance=self.instance.product).serialize_data(),
-            'state': ORDER_STATUS[self.instance.status - 1],
-            'price': self.instance.price,
-            'date_start': self.instance.date_start,
-            'date_end': self.instance.date_end,
-            'delivery_mode': DELIVERY_TYPE[self.instance.delivery_type - 1]
-        }
+# Aggiunge alle card is_favorite per l'utente con una sola query, senza modificare le card in cache
+def mark_favorites(cards, user):
+    favorites = set()
+    if user is not None and user.is_authenticated and len(cards) > 0:
+        favorites = set(Favorite.products.through.objects.filter(
+            favorite__user=user, product_id__in=[card['id'] for card in cards]
+        ).values_list('product_id', flat=True))
+    return [dict(card, is_favorite=card['id'] in favorites) for card in cards]
 
 
 class FavoriteProductSerializer(serializers.Serializer):
@@ -145,8 +174,9 @@ class FavoriteProductSerializer(serializers.Serializer):
     class Meta:
         fields = ['product_id']
 
+    @transaction.atomic
     def save(self, **kwargs):
-        user, product = user_product(self.product_id, kwargs.get('user'))
+        user, product = user_product(self.validated_data['product_id'], kwargs.get('user'))
         if product.status != 4 and product.owner != user:
             raise ValueError('Product status not valid')
         try:
@@ -159,83 +189,139 @@ class FavoriteProductSerializer(serializers.Serializer):
         send_notification(product.owner, 'Prodotto aggiunto nei preferiti', 'Un tuo prodotto è stato aggiunto nei preferiti')
 
     def remove(self, **kwargs):
-        user, product = user_product(self.product_id, kwargs.get('user'))
+        user, product = user_product(self.validated_data['product_id'], kwargs.get('user'))
         try:
             favorite = Favorite.objects.get(user=user, products__pk=product.pk)
         except Favorite.DoesNotExist:
             raise ValueError('This user doesn\'t have this product on his favorites')
-        favorite.delete()
+        # Viene tolto solo questo prodotto, non tutta la lista dei preferiti
+        favorite.products.remove(product)
 
 
 class SubmitOfferSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = ['date_start', 'date_end', 'delivery_mode', 'product_id']
+        fields = ['date_start', 'date_end', 'delivery_mode']
 
+    @booking_transaction
     def save(self, **kwargs):
         user = kwargs.get('user')
         product = kwargs.get('product')
-        if not order_submit_valid(product, self.validated_data['date_start']):
-            raise ValueError('Data start not valid')
+        if user is None or product is None:
+            raise ValueError('User or product not passed')
+        date_start, date_end = self.validated_data['date_start'], self.validated_data['date_end']
+        if date_end < date_start:
+            raise ValueError('Data end before data start')
         if self.validated_data['delivery_mode'] not in [1, 2]:
             raise ValueError('Delivery mode not vaid')
-        self.validated_data['product'] = product
-        self.validated_data['user'] = user
+        # Il calendario in cache scarta subito le date occupate senza bloccare il prodotto
+        if not get_calendar(product.pk).is_free(date_start, date_end):
+            raise ValueError('Data start not valid')
+        # Controllo e inserimento con il prodotto bloccato: due offerte in contemporanea non passano entrambe
+        lock_product(product.pk)
+        if not is_free(product.pk, date_start, date_end):
+            raise ValueError('Data start not valid')
+        window_start, window_end = day_bounds(date_start, date_end)
+        if Order.objects.filter(product=product, user=user, state=1, date_start__lt=window_end, date_end__gte=window_start).exists():
+            raise ValueError('You already have an offer for these dates')
+        order = Order.objects.create(**self.validated_data, user=user, lender=product.owner)
+        order.product.add(product)
         send_notification(product.owner, "Nuova offerta", "Hai ricevuto una offerta per una borsa")
-        return Order.objects.create(**self.validated_data)
+        return order
 
 
-class AvailabilityDatesSerializer(serializers.ModelSerializer):
-    month = serializers.IntegerField(min_value=1, max_value=12, default=datetime.datetime.now().month)
-    year = serializers.IntegerField(min_value=2021, default=datetime.datetime.now().year)
+class AvailabilityDatesSerializer(serializers.Serializer):
+    month = serializers.IntegerField(min_value=1, max_value=12, default=lambda: datetime.date.today().month)
+    year = serializers.IntegerField(min_value=2021, default=lambda: datetime.date.today().year)
 
     class Meta:
         fields = ['month', 'year']
 
     def serialize(self, product):
-        num_days = calendar.monthrange(self.validated_data['year'], self.validated_data['month'])
-        date_start = datetime.datetime(self.validated_data['year'], self.validated_data['month'], 1)
-        date_end = datetime.datetime(self.validated_data['year'], self.validated_data['month'], num_days)
-        filters = Order.objects.filter(product=product, date_start__gte=date_start, date_start__lte=date_end).order_by('date_start')
-        available_dates = [i for i in range(1, num_days)]
-        for item in filters:
-            day = item.date_start.day
-            end_day = item.date_end.day if item.date_start.month == date_end.month else num_days
-            while day != end_day:
-                available_dates.remove(day)
-                day += 1
-        return {'month': self.validated_data['month'], 'year': self.validated_data['year'], 'days_valid': available_dates}
-
-
-class ResponseOfferSerializer(serializers.ModelSerializer):
+        days = get_calendar(product.pk).free_days(self.validated_data['year'], self.validated_data['month'])
+        return {'month': self.validated_data['month'], 'year': self.validated_data['year'], 'days_valid': days}
+
+
+class AvailabilityWindowSerializer(serializers.Serializer):
+    product_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                        min_length=1, max_length=MAX_AVAILABILITY_PRODUCTS)
+    id_brand = serializers.IntegerField(min_value=1, required=False)
+    id_color = serializers.IntegerField(min_value=1, required=False)
+    id_material = serializers.IntegerField(min_value=1, required=False)
+    date_start = serializers.DateField()
+    date_end = serializers.DateField()
+
+    class Meta:
+        fields = ['product_ids', 'id_brand', 'id_color', 'id_material', 'date_start', 'date_end']
+
+    def validate(self, data):
+        if data['date_end'] < data['date_start']:
+            raise serializers.ValidationError('Data end before data start')
+        if (data['date_end'] - data['date_start']).days >= MAX_AVAILABILITY_DAYS:
+            raise serializers.ValidationError('Period longer than %d days' % MAX_AVAILABILITY_DAYS)
+        return data
+
+    def get_product_ids(self):
+        product_ids = self.validated_data.get('product_ids')
+        if product_ids is not None:
+            # Solo i prodotti pubblicati, nell'ordine richiesto: gli altri id vengono ignorati
+            published = set(Product.objects.filter(pk__in=product_ids, status=4).values_list('pk', flat=True))
+            return [pk for pk in dict.fromkeys(product_ids) if pk in published]
+        # Senza una lista di prodotti si usa il catalogo, eventualmente filtrato
+        products = Product.objects.filter(status=4)
+        if self.validated_data.get('id_brand') is not None:
+            products = products.filter(brand_id=self.validated_data['id_brand'])
+        if self.validated_data.get('id_color') is not None:
+            products = products.filter(color_id=self.validated_data['id_color'])
+        if self.validated_data.get('id_material') is not None:
+            products = products.filter(material_id=self.validated_data['id_material'])
+        return list(products.order_by('-id').values_list('pk', flat=True)[:MAX_AVAILABILITY_PRODUCTS])
+
+    def serialize(self):
+        return window_availability(self.get_product_ids(), self.validated_data['date_start'], self.validated_data['date_end'])
+
+
+class ResponseOfferSerializer(serializers.Serializer):
     order_id = serializers.IntegerField(min_value=0)
     result = serializers.BooleanField()
 
     class Meta:
         fields = ['result', 'order_id']
 
+    @booking_transaction
     def save(self, **kwargs):
         product = kwargs.get('product')
         user = kwargs.get('user')
+        # Le offerte nuove aspettano la fine della risposta (e viceversa)
+        lock_product(product.pk)
         try:
-            order = Order.objects.get(product__owner=user, product=product)
+            order = Order.objects.get(pk=self.validated_data['order_id'], product=product, product__owner=user)
         except Order.DoesNotExist:
             raise ValueError('Order not found')
-        if order.status != 1:
+        if order.state != 1:
             raise ValueError('Order already accepted')
-        if self.validated_data['result']:
-            order.status = 2
-            order.save()
-            # Rimuove tutte le offerta con data di inizio compresa tra le due date
-            filters = Order.objects.filter(product=product, date_start__range=[order.date_start, order.date_end])
-            users = []
-            for item in filters:
-                item.delete()
-                users.append(item.user)
-            send_notification(users, 'Risultato dell\'offerta', 'La tua offerta è stata rifiutata', many=True)
-        else:
-            order.delete()
-        send_notification(order.user, 'Risultato dell\'offerta', 'La tua offerta è stata ' + 'accettata' if self.validated_data['result'] else 'rifiutata')
+        if not self.validated_data['result']:
+            order.state = 6
+            order.save(update_fields=['state', 'updated_at'])
+            send_notification(order.user_id, 'Risultato dell\'offerta', 'La tua offerta è stata rifiutata')
+            return order
+        if not is_free(product.pk, order.date_start, order.date_end):
+            raise ValueError('Dates already booked')
+        order.state = 2
+        order.save(update_fields=['state', 'updated_at'])
+        # Le offerte in attesa sovrapposte vengono rifiutate con un solo UPDATE, qualunque sia il loro numero
+        window_start, window_end = day_bounds(order.date_start, order.date_end)
+        competing = Order.objects.filter(
+            product=product, state=1, date_start__lt=window_end, date_end__gte=window_start
+        ).exclude(pk=order.pk)
+        rejected = list(competing.values_list('pk', 'user_id'))
+        if len(rejected) > 0:
+            Order.objects.filter(pk__in=[pk for pk, user_id in rejected]).update(state=6, updated_at=timezone.now())
+            # Un utente con più offerte rifiutate riceve una sola notifica
+            send_notification({user_id for pk, user_id in rejected}, 'Risultato dell\'offerta',
+                              'La tua offerta è stata rifiutata', many=True)
+        send_notification(order.user_id, 'Risultato dell\'offerta', 'La tua offerta è stata accettata')
+        return order
 
 
 class CheckoutSerializer(serializers.ModelSerializer):
@@ -1,83 +1,185 @@
 from rest_framework import serializers
+from django.db.models import Case, Count, When, IntegerField
 from django.http import QueryDict
+from API.settings import BAG_SIZE, BAG_CONDITIONS
+from API.pagination import CursorPaginator
 from client_app.models import User, Product
+from client_app.taxonomy import taxonomy
+from client_app import search_index
+from client_app.name_index import search_users
 from admin_app.serializers import get_brand, get_color, get_material
 
+# Numero massimo di risultati ordinati per rilevanza, contati dopo stato e filtri
+MAX_SEARCH_RESULTS = 500
+
+# Risultati senza testo ordinati come il catalogo, con testo per rilevanza
+search_paginator = CursorPaginator(ordering=('-id',))
+ranked_paginator = CursorPaginator(ordering=('search_rank', 'id'))
+
+# Ricerca degli utenti per nome: i risultati sono limitati
+user_paginator = CursorPaginator(ordering=('score', 'user_id'), limit=20, max_limit=50)
+MAX_USER_START = 500
+
+# Campi dei prodotti per cui vengono contati i risultati della ricerca
+FACETS = {
+    'brand': 'brand_id',
+    'color': 'color_id',
+    'material': 'material_id',
+    'size': 'size',
+    'conditions': 'conditions',
+}
+
 
 class SearchProductSerializer(serializers.ModelSerializer):
     id_brand = serializers.IntegerField(min_value=1, required=False)
     id_color = serializers.IntegerField(min_value=1, required=False)
     id_material = serializers.IntegerField(min_value=1, required=False)
-    start = serializers.IntegerField(min_value=0)
-    limit = serializers.IntegerField(min_value=0)
+    start = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=0, default=50)
+    cursor = serializers.CharField(required=False, allow_blank=True)
+    facets = serializers.BooleanField(default=False)
 
     class Meta:
         model = Product
-        fields = ['id_brand', 'id_color', 'id_material', 'model', 'start', 'limit']
+        fields = ['id_brand', 'id_color', 'id_material', 'model', 'start', 'limit', 'cursor', 'facets']
         extra_kwargs = {
             'model': {'required': False},
         }
 
-    def get_filters(self):
-        filters = None
-        no_data = False
+    # Ordinamento per rilevanza della ricerca full-text, None se non c'è un testo da cercare
+    ranking = None
+    # Prodotti su cui contare i risultati: con il testo tutti quelli trovati, non solo i primi MAX_SEARCH_RESULTS
+    facet_queryset = None
+
+    def get_query(self):
+        # Forma canonica della ricerca, usata come chiave della cache dei risultati
+        model = self.validated_data.get('model')
+        query = {
+            'id_brand': self.validated_data.get('id_brand'),
+            'id_color': self.validated_data.get('id_color'),
+            'id_material': self.validated_data.get('id_material'),
+            'model': ' '.join(search_index.tokenize(model)) if model is not None else None,
+            'facets': self.validated_data['facets'],
+        }
+        if self.validated_data.get('cursor') is not None:
+            query.update({'cursor': self.validated_data['cursor'], 'limit': self.validated_data['limit']})
+        else:
+            query.update({'start': self.validated_data['start'], 'limit': self.validated_data['limit']})
+        return query
+
+    def get_results(self):
+        """
+        Run the search and return the ordered ids of the page, the cursor of the next
+        page and, if requested, the facet counts.
+        """
+        products = self.get_queryset()
+        cursor = self.validated_data.get('cursor')
+        results = {'ids': [], 'next_cursor': None}
+        if products is not None and cursor is not None:
+            paginator = ranked_paginator if self.ranking is not None else search_paginator
+            page, results['next_cursor'] = paginator.paginate(self.rank(products).only('id'), cursor, self.validated_data['limit'])
+            results['ids'] = [item.pk for item in page]
+        elif products is not None:
+            results['ids'] = list(self.get_filters(products).values_list('pk', flat=True))
+        if self.validated_data['facets']:
+            results['facets'] = self.get_facets(self.facet_queryset if self.facet_queryset is not None else products)
+        return results
+
+    def get_filters(self, filters=None):
         start = self.validated_data['start']
         limit = self.validated_data['limit']
+        filters = self.get_queryset() if filters is None else filters
+        if filters is not None:
+            filters = self.rank(filters).order_by('search_rank') if self.ranking is not None else filters.order_by('-id')
+        return [] if filters is None else filters[start:(start + limit)]
+
+    def rank(self, filters):
+        return filters if self.ranking is None else filters.annotate(search_rank=self.ranking)
+
+    # Ritorna il queryset filtrato dei prodotti disponibili, None se uno dei filtri non esiste
+    def get_queryset(self):
+        filters = Product.objects.filter(status=4)
         # Filtro per brand
         if self.data.get('id_brand') is not None:
             brand = get_brand(self.validated_data['id_brand'])
-            if brand is not None:
-                filters = Product.objects.filter(brand=brand)
-            else:
-                no_data = True
+            if brand is None:
+                return None
+            filters = filters.filter(brand=brand)
         # Filtro per color
-        if self.data.get('id_color') is not None and not no_data:
+        if self.data.get('id_color') is not None:
             color = get_color(self.validated_data['id_color'])
-            if color is not None:
-                filters = Product.objects.filter(color=color) if filters is None else filters.filter(color=color)
-            else:
-                no_data = True
+            if color is None:
+                return None
+            filters = filters.filter(color=color)
         # Filtro per material
-        if self.data.get('id_material') is not None and not no_data:
+        if self.data.get('id_material') is not None:
             material = get_material(self.validated_data['id_material'])
-            if material is not None:
-                filters = Product.objects.filter(material=material) if filters is None else filters.filter(material=material)
-            else:
-                no_data = True
-        # Filtro per model
-        if self.data.get('model') is not None and not no_data:
-            filters = Product.objects.filter(model__contains=self.validated_data['model']) if filters is None else filters.filter(model__contains=self.validated_data['model'])
-        return [] if no_data else filters[start:(start + limit)] if filters is not None else Product.objects.all()[start:(start + limit)]
+            if material is None:
+                return None
+            filters = filters.filter(material=material)
+        # Filtro per model, descrizione e brand con l'indice full-text
+        if self.data.get('model') is not None:
+            ids = search_index.match(self.validated_data['model'], MAX_SEARCH_RESULTS, filters)
+            if ids is None:
+                # Database senza indice full-text
+                return filters.filter(model__icontains=self.validated_data['model'])
+            if len(ids) == 0:
+                return None
+            self.ranking = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+            self.facet_queryset = filters.filter(pk__in=search_index.matching(self.validated_data['model']))
+            filters = filters.filter(pk__in=ids)
+        return filters
+
+    def get_facets(self, filters):
+        """
+        Count the products of `filters` by brand, color, material, size and conditions
+        with a single grouped query. The groups are bounded by the size of the taxonomy,
+        not by the number of products.
+        """
+        facets = {name: {} for name in FACETS}
+        if filters is not None:
+            rows = filters.order_by().values(*FACETS.values()).annotate(total=Count('id'))
+            for row in rows:
+                for name, field in FACETS.items():
+                    facets[name][row[field]] = facets[name].get(row[field], 0) + row['total']
+        snapshot = taxonomy.snapshot()
+        return {
+            'brand': [{'id': pk, 'name': snapshot['brand'][pk].name, 'count': count}
+                      for pk, count in facets['brand'].items() if pk in snapshot['brand']],
+            'color': [{'id': pk, 'color': snapshot['color'][pk].color, 'count': count}
+                      for pk, count in facets['color'].items() if pk in snapshot['color']],
+            'material': [{'id': pk, 'material': snapshot['material'][pk].material, 'count': count}
+                         for pk, count in facets['material'].items() if pk in snapshot['material']],
+            'size': [{'id': pk, 'name': name, 'count': facets['size'][pk]}
+                     for pk, name in BAG_SIZE if pk in facets['size']],
+            'conditions': [{'id': pk, 'name': name, 'count': facets['conditions'][pk]}
+                           for pk, name in BAG_CONDITIONS if pk in facets['conditions']],
+        }
 
 
-class SearchUserSerializer(serializers.ModelSerializer):
+class SearchUserSerializer(serializers.Serializer):
     first_name = serializers.CharField(max_length=50, required=False)
     last_name = serializers.CharField(max_length=50, required=False)
-    start = serializers.IntegerField(min_value=0)
-    limit = serializers.IntegerField(min_value=0)
+    start = serializers.IntegerField(min_value=0, max_value=MAX_USER_START, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=user_paginator.max_limit, default=user_paginator.limit)
+    cursor = serializers.CharField(required=False, allow_blank=True)
 
     class Meta:
-        fields = ['first_name', 'last_name', 'start', 'limit']
+        fields = ['first_name', 'last_name', 'start', 'limit', 'cursor']
+
+    # Cursore della pagina successiva, se è stato passato un cursore
+    next_cursor = None
 
     def get_filters(self):
-        is_first_name = self.data.get('first_name') is not None
-        is_last_name = self.data.get('last_name') is not None
-        filters = None
         start = self.validated_data['start']
         limit = self.validated_data['limit']
-        if is_first_name:
-            if is_last_name:
-                filters = User.objects.filter(last_name__contains=self.validated_data['last_name'], first_name__contains=self.validated_data['first_name'])
-            else:
-                filters = User.objects.filter(first_name__contains=self.validated_data['first_name'])
-        elif is_last_name:
-            filters = User.objects.filter(last_name__contains=self.validated_data['last_name'])
-        return [] if filters is None else filters[start:(start + limit)]
-
-
-
-
-
-
-
-
+        matches = search_users(self.validated_data.get('first_name'), self.validated_data.get('last_name'))
+        if matches is None:
+            return []
+        cursor = self.validated_data.get('cursor')
+        if cursor is not None:
+            page, self.next_cursor = user_paginator.paginate(matches, cursor, limit)
+        else:
+            page = matches.order_by(*user_paginator.ordering)[start:(start + limit)]
+        users = User.objects.in_bulk([item['user_id'] for item in page])
+        return [users[item['user_id']] for item in page if item['user_id'] in users]
@@ -0,0 +1,147 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from client_app.availability import invalidate_calendars
+from client_app.derivatives import build_variants
+from client_app.media_access import register_files
+from client_app.cache import invalidate_product_cards, catalog_generation
+from client_app import search_index
+from client_app.name_index import index_users
+from client_app.models import User, Product, Image, Video, Brand, Color, Material, Order, Favorite
+from client_app.taxonomy import taxonomy
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Il login salva solo last_login: l'indice dei nomi va aggiornato solo se cambiano nome o cognome
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    index_users([instance])
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_product_cards([instance.pk])
+    catalog_generation.bump()
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    search_index.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search_index.remove_products([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Image)
+@receiver([post_save, post_delete], sender=Video)
+def media_changed(sender, instance, **kwargs):
+    invalidate_product_cards(Product.objects.filter(media_id=instance.media_id).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=Video)
+def media_file_saved(sender, instance, **kwargs):
+    register_files(instance.media_id, [instance.image.name if sender is Image else instance.video.name])
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, update_fields=None, **kwargs):
+    # Le versioni ridimensionate vengono generate quando l'immagine ha un file e non le ha ancora
+    if instance.image and not instance.variants and (update_fields is None or 'image' in update_fields):
+        build_variants(instance)
+
+
+@receiver([post_save, post_delete], sender=Brand)
+def brand_changed(sender, instance, **kwargs):
+    taxonomy.bump()
+    catalog_generation.bump()
+    invalidate_product_cards(Product.objects.filter(brand=instance).values_list('pk', flat=True))
+    if kwargs.get('created') is False:
+        # Il nome del brand fa parte dell'indice di ricerca
+        search_index.index_products(Product.objects.filter(brand=instance).select_related('brand'))
+
+
+@receiver([post_save, post_delete], sender=Color)
+def color_changed(sender, instance, **kwargs):
+    taxonomy.bump()
+    catalog_generation.bump()
+    invalidate_product_cards(Product.objects.filter(color=instance).values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Material)
+def material_changed(sender, instance, **kwargs):
+    taxonomy.bump()
+    catalog_generation.bump()
+    invalidate_product_cards(Product.objects.filter(material=instance).values_list('pk', flat=True))
+
+
+# I calendari delle prenotazioni dei prodotti di un ordine vengono ricalcolati alla prossima lettura
+@receiver(post_save, sender=Order)
+@receiver(pre_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    # Un ordine appena creato non ha ancora prodotti: vengono aggiunti con m2m_changed
+    if kwargs.get('created'):
+        return
+    invalidate_calendars(instance.product.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Order.product.through)
+def order_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ['post_add', 'post_remove', 'pre_clear']:
+        return
+    if reverse:
+        invalidate_calendars([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_calendars(instance.product.values_list('pk', flat=True))
+    else:
+        invalidate_calendars(pk_set)
+
+
+def update_favorite_counts(counts, sign):
+    """
+    Add (sign 1) or subtract (sign -1) the favorites of `counts`, a dict of product id
+    and number of favorites, with one UPDATE per distinct number.
+    """
+    by_count = {}
+    for pk, count in counts.items():
+        by_count.setdefault(count, []).append(pk)
+    for count, ids in by_count.items():
+        # updated_at cambia con il contatore: ETag e Last-Modified dei prodotti restano corretti
+        Product.objects.filter(pk__in=ids).update(favorite_count=F('favorite_count') + sign * count,
+                                                  updated_at=timezone.now())
+    invalidate_product_cards(counts.keys())
+
+
+def favorite_counts(sender, instance, reverse, pk_set):
+    # Righe della tabella dei preferiti che verranno davvero eliminate
+    if reverse:
+        rows = sender.objects.filter(product_id=instance.pk)
+        if pk_set is not None:
+            rows = rows.filter(favorite_id__in=pk_set)
+        count = rows.count()
+        return {instance.pk: count} if count > 0 else {}
+    rows = sender.objects.filter(favorite_id=instance.pk)
+    if pk_set is not None:
+        rows = rows.filter(product_id__in=pk_set)
+    return {pk: 1 for pk in rows.values_list('product_id', flat=True)}
+
+
+@receiver(m2m_changed, sender=Favorite.products.through)
+def favorite_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        # pk_set contiene solo le righe aggiunte davvero
+        update_favorite_counts({instance.pk: len(pk_set)} if reverse else {pk: 1 for pk in pk_set}, 1)
+    elif action in ['pre_remove', 'pre_clear']:
+        instance._removed_favorites = favorite_counts(sender, instance, reverse, pk_set)
+    elif action in ['post_remove', 'post_clear']:
+        update_favorite_counts(instance.__dict__.pop('_removed_favorites', {}), -1)
+
+
+@receiver(pre_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    # Le righe della tabella dei preferiti vengono eliminate senza m2m_changed
+    update_favorite_counts(favorite_counts(Favorite.products.through, instance, False, None), -1)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import threading
+import time
+from django.conf import settings
+from django.db.models import Count, Max
+from API.counters import VersionCounter
+from client_app.models import Brand, Color, Material
+
+
+class TaxonomyRegistry:
+    """
+    In-memory copy of brands, colors and materials for the current process.
+    The copy is checked against a version counter kept in the cache and reloaded
+    when a write has bumped it. Every TAXONOMY_CHECK_INTERVAL seconds it is also
+    compared with the number and last update of the rows, so the writes of other
+    workers are seen even when the cache is not shared between them.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.version = VersionCounter(settings.TAXONOMY_CACHE, 'taxonomy:version')
+
+    def get_version(self):
+        return self.version.get()
+
+    def bump(self):
+        self.version.bump()
+
+    def get_state(self):
+        # Cambia con ogni inserimento, modifica o eliminazione di brand, colori e materiali
+        return tuple(
+            tuple(model.objects.aggregate(total=Count('pk'), updated_at=Max('updated_at')).values())
+            for model in (Brand, Color, Material)
+        )
+
+    def load(self, version, state):
+        # Import locale per evitare un import circolare con admin_app.serializers
+        from admin_app.serializers import BrandSerializer, ColorSerializer, MaterialSerializer
+        brands = {item.pk: item for item in Brand.objects.order_by('pk')}
+        colors = {item.pk: item for item in Color.objects.order_by('pk')}
+        materials = {item.pk: item for item in Material.objects.order_by('pk')}
+        data = {
+            'brands': BrandSerializer(instance=brands.values(), many=True).data,
+            'colors': ColorSerializer(instance=colors.values(), many=True).data,
+            'materials': MaterialSerializer(instance=materials.values(), many=True).data,
+        }
+        return {
+            'version': version,
+            'state': state,
+            'brand': brands,
+            'color': colors,
+            'material': materials,
+            'data': data,
+            'etag': hashlib.md5(json.dumps(data).encode()).hexdigest(),
+        }
+
+    def is_current(self, snapshot, version):
+        return snapshot is not None and snapshot['version'] == version and time.monotonic() < snapshot['expires']
+
+    def snapshot(self):
+        version = self.get_version()
+        snapshot = self._snapshot
+        if not self.is_current(snapshot, version):
+            with self._lock:
+                snapshot = self._snapshot
+                if not self.is_current(snapshot, version):
+                    state = self.get_state()
+                    if snapshot is None or snapshot['version'] != version or snapshot['state'] != state:
+                        snapshot = self.load(version, state)
+                    else:
+                        # Nessuna modifica: la copia resta valida per un altro intervallo
+                        snapshot = dict(snapshot)
+                    snapshot['expires'] = time.monotonic() + settings.TAXONOMY_CHECK_INTERVAL
+                    self._snapshot = snapshot
+        return snapshot
+
+    def get_brand(self, pk):
+        return self.snapshot()['brand'].get(pk)
+
+    def get_color(self, pk):
+        return self.snapshot()['color'].get(pk)
+
+    def get_material(self, pk):
+        return self.snapshot()['material'].get(pk)
+
+
+taxonomy = TaxonomyRegistry()
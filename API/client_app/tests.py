@@ -1,3 +1,421 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+from django.core.cache import caches
+from django.db import OperationalError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image as PILImage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from client_app.media_access import register_files
+from client_app.availability import get_cache as get_availability_cache, get_calendar
+from client_app.taxonomy import taxonomy
+from client_app.models import User, Address, Brand, Color, Material, Media, Product, Order, VideoUpload, Image, Notification, OutgoingEmail
+from client_app.uploads import create_upload, part_path, COMPLETED
+from client_app import mailer
+from client_app.derivatives import store_variants
 
-# Create your tests here.
+
+@override_settings(IMAGE_WORKERS=0)
+class SisterlyTestCase(TestCase):
+    def setUp(self):
+        # Le cache locali sopravvivono al rollback dei test
+        for alias in ['default', 'search']:
+            caches[alias].clear()
+        self.owner = self.create_user('owner@sisterly.local')
+        self.address = Address.objects.create(user=self.owner, name='Casa', address1='Via Roma 1', country='IT',
+                                              province='MI', city='Milano', zip='20100')
+        self.brand = Brand.objects.create(name='Gucci')
+        self.color = Color.objects.create(color='Rosso')
+        self.material = Material.objects.create(material='Pelle')
+
+    def create_user(self, email, **kwargs):
+        return User.objects.create_user(email=email, password='password', first_name='Anna', last_name='Rossi', **kwargs)
+
+    def create_product(self, status=4, **kwargs):
+        data = {
+            'owner': self.owner, 'media': Media.objects.create(user=self.owner), 'model': 'Borsa',
+            'brand': self.brand, 'color': self.color, 'material': self.material, 'conditions': 1, 'year': 1,
+            'size': 1, 'status': status, 'delivery_type': 1, 'delivery_kit': self.address,
+        }
+        data.update(kwargs)
+        return Product.objects.create(**data)
+
+    def create_order(self, product, user, state=1, delivery_mode=1, start='2030-03-01T10:00:00Z', end='2030-03-03T10:00:00Z'):
+        order = Order.objects.create(user=user, lender=product.owner, state=state, delivery_mode=delivery_mode,
+                                     date_start=start, date_end=end)
+        order.product.add(product)
+        return order
+
+    def use_temporary_directory(self, setting):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(**{setting: directory})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class OrderListTest(SisterlyTestCase):
+    def test_face_to_face_or_rider_orders(self):
+        borrower = self.create_user('borrower@sisterly.local')
+        product = self.create_product()
+        self.create_order(product, borrower, state=1, delivery_mode=12)
+        self.create_order(product, borrower, state=2, delivery_mode=12, start='2030-04-01T10:00:00Z',
+                          end='2030-04-02T10:00:00Z')
+        response = self.client_for(self.owner).get('/product/offers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['results'][0]['delivery_mode'], [12, 'FACE_TO_FACE_OR_RIDER'])
+        response = self.client_for(self.owner).get('/product/%d/offer/' % product.pk)
+        self.assertEqual(response.status_code, 200)
+        response = self.client_for(borrower).get('/product/orders/')
+        self.assertEqual([item['state'][0] for item in response.json()['data']['results']], [2, 1])
+        response = self.client_for(borrower).get('/product/cart')
+        self.assertEqual([item['state'][0] for item in response.json()['data']['results']], [2])
+
+    def test_cart_pages(self):
+        borrower = self.create_user('borrower@sisterly.local')
+        orders = [self.create_order(self.create_product(), borrower, state=2) for _ in range(3)]
+        client = self.client_for(borrower)
+        data = client.get('/product/cart', {'limit': 2}).json()['data']
+        self.assertEqual([item['id'] for item in data['results']], [orders[2].pk, orders[1].pk])
+        data = client.get('/product/cart', {'limit': 2, 'cursor': data['next_cursor']}).json()['data']
+        self.assertEqual([item['id'] for item in data['results']], [orders[0].pk])
+        self.assertIsNone(data['next_cursor'])
+
+
+class SearchProductTest(SisterlyTestCase):
+    @mock.patch('client_app.serializers.search.MAX_SEARCH_RESULTS', 2)
+    def test_limit_after_filters(self):
+        # Prodotti non pubblicati o di un altro colore che corrispondono al testo
+        for _ in range(3):
+            self.create_product(status=1, model='Borsa tracolla')
+        other = Color.objects.create(color='Nero')
+        for _ in range(3):
+            self.create_product(model='Borsa tracolla', color=other)
+        product = self.create_product(model='Borsa tracolla')
+        data = {'model': 'tracolla', 'id_color': self.color.pk, 'cursor': '', 'facets': True}
+        response = self.client_for(self.owner).post('/product/search/', data, format='json')
+        data = response.json()['data']
+        self.assertEqual([item['id'] for item in data['results']], [product.pk])
+        self.assertEqual(data['facets']['color'], [{'id': self.color.pk, 'color': 'Rosso', 'count': 1}])
+
+    @mock.patch('client_app.serializers.search.MAX_SEARCH_RESULTS', 2)
+    def test_facets_count_every_match(self):
+        for _ in range(3):
+            self.create_product(model='Borsa tracolla')
+        data = {'model': 'tracolla', 'cursor': '', 'facets': True}
+        data = self.client_for(self.owner).post('/product/search/', data, format='json').json()['data']
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(data['facets']['brand'], [{'id': self.brand.pk, 'name': 'Gucci', 'count': 3}])
+
+
+class MediaAccessTest(SisterlyTestCase):
+    def setUp(self):
+        super().setUp()
+        # Prodotto in revisione: il video di verifica è visibile solo al proprietario e agli admin
+        self.use_temporary_directory('MEDIA_ROOT')
+        self.product = self.create_product(status=2)
+        self.name = default_storage.save('video/review.mp4', ContentFile(b'video'))
+        register_files(self.product.media_id, [self.name])
+
+    def get(self, user):
+        return self.client_for(user).get('/media/' + self.name)
+
+    def test_admin_reads_media_under_review(self):
+        admin = self.create_user('admin@sisterly.local', is_admin=True)
+        self.assertEqual(self.get(admin).status_code, 200)
+        self.assertEqual(self.get(self.owner).status_code, 200)
+
+    def test_other_user_cannot_read_media_under_review(self):
+        self.assertEqual(self.get(self.create_user('other@sisterly.local')).status_code, 403)
+        # Lo staff di Django non è un admin dell'app
+        self.assertEqual(self.get(self.create_user('staff@sisterly.local', is_staff=True)).status_code, 403)
+
+
+class TaxonomyTest(SisterlyTestCase):
+    def test_changes_of_other_workers(self):
+        self.assertEqual(taxonomy.get_brand(self.brand.pk), self.brand)
+        # bulk_create non invia segnali: è come la scrittura di un altro worker con la sua cache locale
+        Brand.objects.bulk_create([Brand(name='Prada')])
+        brand = Brand.objects.get(name='Prada')
+        with override_settings(TAXONOMY_CHECK_INTERVAL=60):
+            taxonomy.snapshot()
+        self.assertIsNone(taxonomy.get_brand(brand.pk))
+        with mock.patch('client_app.taxonomy.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(taxonomy.get_brand(brand.pk), brand)
+
+
+class AvailabilityTest(SisterlyTestCase):
+    def test_booking_seen_by_other_workers(self):
+        product = self.create_product()
+        borrower = self.create_user('borrower@sisterly.local')
+        self.assertTrue(get_calendar(product.pk).is_free(datetime.date(2030, 3, 1), datetime.date(2030, 3, 2)))
+        # Un altro worker con la sua cache locale: la cache di questo processo non viene toccata
+        with mock.patch.object(get_availability_cache(), 'delete_many'), \
+                mock.patch.object(get_availability_cache(), 'delete'):
+            self.create_order(product, borrower, state=2)
+        self.assertFalse(get_calendar(product.pk).is_free(datetime.date(2030, 3, 1), datetime.date(2030, 3, 2)))
+        response = self.client_for(borrower).get('/product/%d/validDates/' % product.pk, {'month': 3, 'year': 2030})
+        self.assertNotIn(1, response.json()['data']['days_valid'])
+
+
+class AvailabilityWindowTest(SisterlyTestCase):
+    def test_only_published_products(self):
+        published = self.create_product()
+        draft = self.create_product(status=1)
+        data = {'product_ids': [99999, draft.pk, published.pk], 'date_start': '2030-03-01', 'date_end': '2030-03-02'}
+        response = APIClient().post('/product/availability/', data, format='json')
+        self.assertEqual([item['id'] for item in response.json()['data']], [published.pk])
+
+
+class OfferTest(SisterlyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_product()
+        self.borrower = self.create_user('borrower@sisterly.local')
+
+    def make_offer(self, start='2030-03-01T10:00:00Z', end='2030-03-03T10:00:00Z'):
+        data = {'date_start': start, 'date_end': end, 'delivery_mode': 1}
+        return self.client_for(self.borrower).put('/product/%d/offer/make/' % self.product.pk, data, format='json')
+
+    def test_offer_on_booked_dates(self):
+        self.create_order(self.product, self.create_user('other@sisterly.local'), state=2)
+        response = self.make_offer()
+        self.assertEqual(response.json()['errors'], ['Data start not valid'])
+        self.assertEqual(self.make_offer('2030-03-10T10:00:00Z', '2030-03-11T10:00:00Z').status_code, 200)
+
+    def test_concurrent_offer(self):
+        # Su SQLite l'offerta in contemporanea trova il database bloccato alla prima scrittura
+        with mock.patch('client_app.serializers.product.Order.objects.create',
+                        side_effect=OperationalError('database is locked')):
+            response = self.make_offer()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], ['Product is being booked by another user, try again'])
+        self.assertFalse(Order.objects.exists())
+
+    def test_product_locked_by_another_request(self):
+        # Come l'errore di psycopg2 per una riga bloccata con nowait, avvolto da Django
+        error = OperationalError('could not obtain lock on row')
+        error.__cause__ = Exception('could not obtain lock on row')
+        error.__cause__.pgcode = '55P03'
+        with mock.patch('django.db.models.query.QuerySet.select_for_update', side_effect=error):
+            response = self.make_offer()
+        self.assertEqual(response.json()['errors'], ['Product is being booked by another user, try again'])
+
+    def test_other_database_errors_propagate(self):
+        for target in ['client_app.serializers.product.Order.objects.create',
+                       'django.db.models.query.QuerySet.select_for_update']:
+            with mock.patch(target, side_effect=OperationalError('disk I/O error')):
+                with self.assertRaises(OperationalError):
+                    self.make_offer()
+        self.assertFalse(Order.objects.exists())
+
+
+class VideoUploadTest(SisterlyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_directory('UPLOAD_TEMP_DIR')
+        self.media = Media.objects.create(user=self.owner)
+        self.upload = create_upload(self.owner, self.media, 'verifica.mp4', 4, '0' * 64)
+        self.url = '/client/media/%d/videos/uploads/%d' % (self.media.pk, self.upload.pk)
+
+    def put_chunk(self):
+        return self.client_for(self.owner).put(self.url, b'data', content_type='application/octet-stream',
+                                               HTTP_CONTENT_RANGE='bytes 0-3/4')
+
+    def test_chunk_after_abort(self):
+        self.assertEqual(self.client_for(self.owner).delete(self.url).status_code, 200)
+        response = self.put_chunk()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], ['Upload aborted'])
+
+    def test_chunk_without_partial_file(self):
+        # File parziale eliminato (es. cartella temporanea svuotata)
+        os.remove(part_path(self.upload))
+        response = self.put_chunk()
+        self.assertEqual(response.json()['errors'], ['Partial file not found, start a new upload'])
+        self.assertEqual(VideoUpload.objects.get(pk=self.upload.pk).received, 0)
+
+    def test_abort_completed_upload(self):
+        VideoUpload.objects.filter(pk=self.upload.pk).update(status=COMPLETED)
+        response = self.client_for(self.owner).delete(self.url)
+        self.assertEqual(response.json()['errors'], ['Upload already completed'])
+        self.assertEqual(VideoUpload.objects.get(pk=self.upload.pk).status, COMPLETED)
+
+
+class ConditionalTest(SisterlyTestCase):
+    def test_deleted_address(self):
+        other = Address.objects.create(user=self.owner, name='Ufficio', address1='Via Milano 2', country='IT',
+                                       province='MI', city='Milano', zip='20100')
+        client = self.client_for(self.owner)
+        response = client.get('/client/address')
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(client.get('/client/address', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        other.delete()
+        response = client.get('/client/address', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']), 1)
+
+
+class SearchUserTest(SisterlyTestCase):
+    def search(self, **data):
+        return APIClient().post('/client/search', data, format='json')
+
+    def test_short_terms(self):
+        user = User.objects.create_user(email='maria@sisterly.local', password='password', first_name='Maria', last_name='Li')
+        response = self.search(first_name='ma')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], ['Search at least 3 characters'])
+        # Le parole corte vengono ignorate se ce ne sono altre
+        response = self.search(first_name='mari', last_name='li')
+        self.assertEqual([item['id'] for item in response.json()['data']], [user.pk])
+
+
+class ImageUploadTest(SisterlyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_directory('MEDIA_ROOT')
+        self.media = Media.objects.create(user=self.owner)
+
+    def image_file(self, name='foto.png'):
+        data = io.BytesIO()
+        PILImage.new('RGB', (8, 8), (255, 0, 0)).save(data, 'PNG')
+        return SimpleUploadedFile(name, data.getvalue(), content_type='image/png')
+
+    def upload(self, *files):
+        return self.client_for(self.owner).post('/client/media/%d/images' % self.media.pk, {'images': list(files)},
+                                                format='multipart')
+
+    def test_same_file_uploaded_again(self):
+        first = self.upload(self.image_file()).json()['data']
+        # Con lo storage per contenuto il file ha lo stesso nome della riga già esistente
+        second = self.upload(self.image_file('copia.png'), self.image_file('altra.png')).json()['data']
+        self.assertEqual(len(second), 2)
+        self.assertNotIn(first[0]['id'], [item['id'] for item in second])
+        self.assertEqual(Image.objects.filter(media=self.media).count(), 3)
+
+
+class FavoriteTest(SisterlyTestCase):
+    def change(self, user, product, delete=False):
+        client = self.client_for(user)
+        data = {'product_id': product.pk}
+        return client.delete('/product/favorite/change/', data, format='json') if delete else \
+            client.post('/product/favorite/change/', data, format='json')
+
+    def test_favorite_count_and_flag(self):
+        products = [self.create_product() for _ in range(3)]
+        users = [self.create_user('user%d@sisterly.local' % i) for i in range(2)]
+        for user in users:
+            self.assertEqual(self.change(user, products[0]).status_code, 200)
+        self.change(users[0], products[1])
+        # Un'istanza letta prima delle modifiche non sovrascrive il contatore
+        stale = Product.objects.get(pk=products[0].pk)
+        self.change(users[0], products[0], delete=True)
+        stale.model = 'Borsa nuova'
+        stale.save()
+        counts = dict(Product.objects.values_list('pk', 'favorite_count'))
+        self.assertEqual([counts[item.pk] for item in products], [1, 1, 0])
+        data = self.client_for(users[0]).get('/product/', {'cursor': ''}).json()['data']
+        self.assertEqual({item['id']: item['is_favorite'] for item in data['results']},
+                         {products[0].pk: False, products[1].pk: True, products[2].pk: False})
+        self.assertEqual(data['results'][1]['favorite_count'], 1)
+
+
+class ResponseOfferTest(SisterlyTestCase):
+    def test_accept_rejects_overlapping_offers(self):
+        product = self.create_product()
+        borrowers = [self.create_user('borrower%d@sisterly.local' % i) for i in range(4)]
+        accepted = self.create_order(product, borrowers[0])
+        overlapping = [self.create_order(product, user, start='2030-03-02T10:00:00Z', end='2030-03-05T10:00:00Z')
+                       for user in borrowers[1:3]]
+        later = self.create_order(product, borrowers[3], start='2030-03-10T10:00:00Z', end='2030-03-12T10:00:00Z')
+        response = self.client_for(self.owner).post('/product/%d/offer/' % product.pk,
+                                                     {'order_id': accepted.pk, 'result': True}, format='json')
+        self.assertEqual(response.json()['data'], 'Order accepted')
+        states = dict(Order.objects.values_list('pk', 'state'))
+        self.assertEqual(states[accepted.pk], 2)
+        self.assertEqual([states[item.pk] for item in overlapping], [6, 6])
+        self.assertEqual(states[later.pk], 1)
+        self.assertFalse(get_calendar(product.pk).is_free(datetime.date(2030, 3, 1), datetime.date(2030, 3, 1)))
+        self.assertEqual(Notification.objects.filter(user__in=borrowers[1:3]).count(), 2)
+
+
+class UnreachableEmailBackend(BaseEmailBackend):
+    # Server SMTP su una porta chiusa
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('Connection refused')
+
+
+class BrokenConnectionEmailBackend(BaseEmailBackend):
+    # La prima email fallisce e la connessione non si riapre più
+    opened = 0
+
+    def open(self):
+        BrokenConnectionEmailBackend.opened += 1
+        if BrokenConnectionEmailBackend.opened > 1:
+            raise ConnectionRefusedError('Connection refused')
+
+    def send_messages(self, messages):
+        raise ConnectionResetError('Connection reset')
+
+
+@override_settings(EMAIL_MAX_ATTEMPTS=2, EMAIL_RETRY_DELAY=60)
+class MailerTest(SisterlyTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            mailer.enqueue_email('Oggetto', 'Testo', 'user%d@sisterly.local' % i)
+
+    def assert_retried(self, attempts, status):
+        for row in OutgoingEmail.objects.all():
+            self.assertEqual((row.status, row.attempts), (status, attempts))
+            self.assertIn('Connection', row.error)
+
+    @override_settings(EMAIL_BACKEND='client_app.tests.UnreachableEmailBackend')
+    def test_server_unreachable(self):
+        result = mailer.deliver(mailer.claim())
+        self.assertEqual(result[mailer.PENDING], 3)
+        self.assert_retried(1, mailer.PENDING)
+        self.assertTrue(all(row.next_attempt_at > timezone.now() for row in OutgoingEmail.objects.all()))
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        result = mailer.deliver(mailer.claim())
+        self.assertEqual(result[mailer.FAILED], 3)
+        self.assert_retried(2, mailer.FAILED)
+
+    @override_settings(EMAIL_BACKEND='client_app.tests.BrokenConnectionEmailBackend')
+    def test_connection_lost_during_batch(self):
+        BrokenConnectionEmailBackend.opened = 0
+        result = mailer.deliver(mailer.claim())
+        self.assertEqual(result[mailer.PENDING], 3)
+        self.assert_retried(1, mailer.PENDING)
+
+
+class ImageVariantsTest(SisterlyTestCase):
+    def test_variants_change_etag(self):
+        product = self.create_product()
+        image = Image.objects.create(media=product.media, image='images/foto.png', order=1)
+        Image.objects.filter(pk=image.pk).update(updated_at=timezone.now() - datetime.timedelta(minutes=1))
+        client = self.client_for(self.owner)
+        etag = client.get('/product/%d/' % product.pk)['ETag']
+        variants = {'card': {'width': 480, 'height': 480, 'webp': 'images/variants/foto_card.webp'}}
+        store_variants(image.pk, 'images/foto.png', variants)
+        response = client.get('/product/%d/' % product.pk, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('card', response.json()['data']['media']['images'][0]['variants'])
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import re
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from client_app.models import Video, VideoUpload
+
+# Stati del caricamento (settings.UPLOAD_STATUS)
+UPLOADING = 1
+COMPLETED = 2
+ABORTED = 3
+
+# Dimensione dei blocchi letti dalla richiesta e dal disco: la memoria usata non dipende dal file
+BLOCK_SIZE = 64 * 1024
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class PartFile(File):
+    # Il file parziale viene spostato nello storage invece di essere copiato
+    def __init__(self, file, sha256=None):
+        super().__init__(file)
+        # Checksum già verificato, lo storage non deve rileggere il file
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(upload):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, '%d.part' % upload.pk)
+
+
+def create_upload(user, media, filename, size, sha256, order=0):
+    upload = VideoUpload.objects.create(user=user, media=media, filename=filename, size=size,
+                                        sha256=sha256.lower(), order=order)
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def parse_content_range(header, size):
+    """
+    Return the (start, end) byte positions, inclusive, of a Content-Range header
+    like `bytes 0-1048575/73400320`.
+    """
+    match = CONTENT_RANGE.match(header or '')
+    if match is None:
+        raise ValueError('Content-Range not valid')
+    start, end, total = (int(value) for value in match.groups())
+    if total != size or start > end or end >= size:
+        raise ValueError('Content-Range not valid')
+    if end - start + 1 > settings.UPLOAD_CHUNK_MAX_SIZE:
+        raise ValueError('Chunk bigger than %d bytes' % settings.UPLOAD_CHUNK_MAX_SIZE)
+    return start, end
+
+
+def check_uploading(upload):
+    if upload.status == ABORTED:
+        raise ValueError('Upload aborted')
+    if upload.status != UPLOADING:
+        raise ValueError('Upload already completed')
+
+
+def write_chunk(upload, stream, start, end):
+    """
+    Write the bytes start..end read from `stream` in the partial file. A chunk can only
+    start within the bytes already received, so the file never has holes and a chunk
+    interrupted by the network is simply sent again. Return the bytes received so far.
+    """
+    with transaction.atomic():
+        upload = VideoUpload.objects.select_for_update().get(pk=upload.pk)
+        check_uploading(upload)
+        if start > upload.received:
+            raise ValueError('Chunk starts after the received bytes (%d)' % upload.received)
+        length = end - start + 1
+        try:
+            part = open(part_path(upload), 'r+b')
+        except FileNotFoundError:
+            raise ValueError('Partial file not found, start a new upload')
+        with part:
+            part.seek(start)
+            while length > 0:
+                block = stream.read(min(BLOCK_SIZE, length))
+                if not block:
+                    break
+                part.write(block)
+                length -= len(block)
+        if length > 0:
+            # La richiesta si è interrotta: vale solo la parte arrivata
+            end -= length
+        upload.received = max(upload.received, end + 1)
+        upload.save(update_fields=['received', 'updated_at'])
+    return upload.received
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize_upload(upload):
+    """
+    Check size and checksum of the received file and move it into a new Video of the media.
+    """
+    with transaction.atomic():
+        upload = VideoUpload.objects.select_for_update().get(pk=upload.pk)
+        check_uploading(upload)
+        path = part_path(upload)
+        if not os.path.exists(path):
+            raise ValueError('Partial file not found, start a new upload')
+        if upload.received != upload.size or os.path.getsize(path) != upload.size:
+            raise ValueError('Upload not completed: %d of %d bytes received' % (upload.received, upload.size))
+        if file_checksum(path) != upload.sha256:
+            raise ValueError('Checksum not valid')
+        video = Video.objects.create(media=upload.media, order=upload.order)
+        with open(path, 'rb') as part:
+            video.video.save(upload.filename, PartFile(part, upload.sha256), save=True)
+        # Se il file era già presente nello storage il file parziale non è stato spostato
+        if os.path.exists(path):
+            os.remove(path)
+        upload.video = video
+        upload.status = COMPLETED
+        upload.save(update_fields=['video', 'status', 'updated_at'])
+    return video
+
+
+def abort_upload(upload):
+    with transaction.atomic():
+        upload = VideoUpload.objects.select_for_update().get(pk=upload.pk)
+        # Il video di un caricamento completato appartiene già al media
+        if upload.status == COMPLETED:
+            raise ValueError('Upload already completed')
+        upload.status = ABORTED
+        upload.save(update_fields=['status', 'updated_at'])
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+    return upload
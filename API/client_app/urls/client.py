@@ -15,7 +15,17 @@ from client_app.views.client import (
 )
 from client_app.views.search import SearchUserView
 from django.contrib.auth import views as auth_views
-from client_app.views.media import MediaView, ImageView, VideoView, ImageDeleteView, VideoDeleteView, MediaInfoView
+from client_app.views.media import (
+    MediaView,
+    ImageView,
+    VideoView,
+    ImageDeleteView,
+    VideoDeleteView,
+    MediaInfoView,
+    VideoUploadView,
+    VideoUploadInfoView,
+    VideoUploadFinalizeView
+)
 
 urlpatterns = [
     path('register', registration, name="register"),
@@ -46,6 +56,10 @@ urlpatterns = [
     path('media/<int:pk>/images/<int:pk_image>', ImageDeleteView.as_view(), name='delete_image'),
     path('media/<int:pk>/videos', VideoView.as_view(), name='media_video'),
     path('media/<int:pk>/videos/<int:pk_video>', VideoDeleteView.as_view(), name='delete_video'),
+    path('media/<int:pk>/videos/uploads', VideoUploadView.as_view(), name='video_upload'),
+    path('media/<int:pk>/videos/uploads/<int:pk_upload>', VideoUploadInfoView.as_view(), name='video_upload_info'),
+    path('media/<int:pk>/videos/uploads/<int:pk_upload>/finalize', VideoUploadFinalizeView.as_view(),
+         name='video_upload_finalize'),
     # Ricerca
     path('search', SearchUserView.as_view(), name='user_search')
 ]
@@ -9,17 +9,22 @@ from client_app.views.product import (
     FavoriteView,
     get_favorites,
     AvailabilityDatesView,
+    AvailabilityView,
     make_offer,
     OfferView,
+    OfferInboxView,
     get_cart,
+    OrderHistoryView,
     CheckoutView
 )
 from client_app.views.search import SearchProductView
+from client_app.views.taxonomy import TaxonomyView
 
 
 urlpatterns = [
     path('', ProductView.as_view(), name='product'),
     path('search/', SearchProductView.as_view(), name='search_product'),
+    path('taxonomy/', TaxonomyView.as_view(), name='taxonomy'),
     # User product
     path('my/', MyProductView.as_view(), name='my_products'),
     path('<int:pk>/sentToVerification/', SendVerificationProductView.as_view(), name='product_sent_to_preview'),
@@ -27,6 +32,10 @@ urlpatterns = [
     # Favorites
     path('favorite/', get_favorites, name='favorite_products'),
     path('favorite/change/', FavoriteView.as_view(), name='favorite_products'),
+    # Disponibilità di più prodotti
+    path('availability/', AvailabilityView.as_view(), name='products_availability'),
+    # Offerte ricevute su tutti i prodotti
+    path('offers/', OfferInboxView.as_view(), name='offer_inbox'),
     # Product offer
     path('<int:pk>/', ProductInfoView.as_view(), name='product_info'),
     path('<int:pk>/validDates/', AvailabilityDatesView.as_view(), name='product_info_date'),
@@ -34,6 +43,7 @@ urlpatterns = [
     path('<int:pk>/offer/make/', make_offer, name='offer'),
     # Checkout paths
     path('cart', get_cart, name='get_cart'),
+    path('orders/', OrderHistoryView.as_view(), name='order_history'),
     path('<int:pk>/checkout', CheckoutView.as_view(), name='checkout'),
 ]
 urlpatterns = format_suffix_patterns(urlpatterns)
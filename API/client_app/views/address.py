@@ -2,7 +2,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from client_app.models import Address
 from client_app.serializers.address import AddressSerializer
-from API.static import send_error, send_success
+from API.static import send_error, send_success, conditional, get_validator
+
+
+def addresses_version(request):
+    return get_validator(Address.objects.filter(user=request.user), 'updated_at', counts=['pk'])
 
 
 class AddressView(APIView):
@@ -18,6 +22,7 @@ class AddressView(APIView):
         return send_error(serializer.error_messages)
 
     # Ottiene la lista di tutti gli indirizzi di un utente
+    @conditional(addresses_version)
     def get(self, request):
         user = request.user
         if user is None:
@@ -2,7 +2,6 @@ import datetime
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import EmailMessage
 from django.shortcuts import render, redirect
 from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes, force_text
@@ -17,6 +16,7 @@ from client_app.forms import EmailResetForm
 from client_app.serializers.client import RegistrationSerializer, PlayerIdSerializer
 from client_app.models import User, Device
 from client_app.tokens import account_activation_token, email_change_token
+from client_app.mailer import enqueue_email
 from API.static import send_error, send_success
 
 
@@ -111,10 +111,8 @@ def send_email(request, user, token, template, uid=True):
         'uid' if uid else 'uidb64': urlsafe_base64_encode(force_bytes(user.pk)),
         'token': token,
     })
-    email = EmailMessage(
-        subject, message, to=[user.email]
-    )
-    email.send()
+    # L'email viene inviata dal worker (manage.py send_emails)
+    enqueue_email(subject, message, user.email)
 
 
 @api_view(['GET'])
@@ -1,8 +1,24 @@
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
-from API.static import send_success, send_error
-from client_app.models import Media, Image, Video
-from client_app.serializers.media import ImageSerializer, VideoSerializer, MediaSerializer
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.permissions import AllowAny
+from API.static import send_success, send_error, conditional, get_validator
+from API.sendfile import send_file
+from API.storage import IMMUTABLE_CACHE_CONTROL, PRIVATE_CACHE_CONTROL
+from client_app.media_access import get_access
+from client_app.models import Media, Image, Video, VideoUpload
+from client_app.serializers.media import (
+    ImageSerializer,
+    ImageBatchSerializer,
+    VideoSerializer,
+    MediaSerializer,
+    VideoUploadSerializer
+)
+from client_app.images import save_images
+from client_app.uploads import parse_content_range, write_chunk, finalize_upload, abort_upload
 
 
 class MediaView(APIView):
@@ -17,7 +33,16 @@ class MediaView(APIView):
         return send_success({'id': str(new_media.pk)})
 
 
+def media_version(request, pk):
+    return get_validator(
+        Media.objects.filter(pk=pk, user=request.user),
+        'updated_at', 'image__updated_at', 'video__updated_at',
+        counts=['image', 'video']
+    )
+
+
 class MediaInfoView(APIView):
+    @conditional(media_version)
     def get(self, request, pk):
         try:
             media = Media.objects.get(pk=pk, user=request.user)
@@ -48,6 +73,18 @@ class ImageView(APIView):
                 return send_error('No media passed')
         return send_error(serializer.error_messages)
 
+    def post(self, request, pk):
+        # Più immagini nella stessa richiesta: images (file) e orders, nello stesso ordine
+        try:
+            media = Media.objects.get(pk=pk, user=request.user)
+        except Media.DoesNotExist:
+            return send_error('Media not found')
+        serializer = ImageBatchSerializer(data=request.data)
+        if serializer.is_valid():
+            images = save_images(media, serializer.validated_data['images'], serializer.validated_data['orders'])
+            return send_success(ImageSerializer(instance=images, many=True).data)
+        return send_error(serializer.errors)
+
 
 class ImageDeleteView(APIView):
     def delete(self, request, pk, pk_image):
@@ -87,3 +124,90 @@ class VideoDeleteView(APIView):
         video.active = False
         video.save()
         return send_success('Video was become not active')
+
+
+def get_upload(request, pk, pk_upload):
+    try:
+        return VideoUpload.objects.select_related('media').get(pk=pk_upload, media_id=pk, user=request.user)
+    except VideoUpload.DoesNotExist:
+        return None
+
+
+class VideoUploadView(APIView):
+    def post(self, request, pk):
+        try:
+            media = Media.objects.get(pk=pk, user=request.user)
+        except Media.DoesNotExist:
+            return send_error('Media not found')
+        serializer = VideoUploadSerializer(data=request.data)
+        if serializer.is_valid():
+            upload = serializer.save(user=request.user, media=media)
+            data = VideoUploadSerializer(instance=upload).data
+            data['chunk_size'] = settings.UPLOAD_CHUNK_MAX_SIZE
+            return send_success(data)
+        return send_error(serializer.errors)
+
+
+class VideoUploadInfoView(APIView):
+    def get(self, request, pk, pk_upload):
+        upload = get_upload(request, pk, pk_upload)
+        if upload is None:
+            return send_error('Upload not found')
+        return send_success(VideoUploadSerializer(instance=upload).data)
+
+    def put(self, request, pk, pk_upload):
+        # Il corpo della richiesta contiene i byte indicati da Content-Range e viene letto a blocchi
+        upload = get_upload(request, pk, pk_upload)
+        if upload is None:
+            return send_error('Upload not found')
+        try:
+            start, end = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'), upload.size)
+            if request.stream is None or int(request.META.get('CONTENT_LENGTH') or 0) != end - start + 1:
+                raise ValueError('Content-Length not valid')
+            received = write_chunk(upload, request.stream, start, end)
+        except ValueError as e:
+            return send_error(e.args)
+        return send_success({'received': received})
+
+    def delete(self, request, pk, pk_upload):
+        upload = get_upload(request, pk, pk_upload)
+        if upload is None:
+            return send_error('Upload not found')
+        try:
+            abort_upload(upload)
+        except ValueError as e:
+            return send_error(e.args)
+        return send_success('Upload aborted')
+
+
+class VideoUploadFinalizeView(APIView):
+    def post(self, request, pk, pk_upload):
+        upload = get_upload(request, pk, pk_upload)
+        if upload is None:
+            return send_error('Upload not found')
+        try:
+            video = finalize_upload(upload)
+        except ValueError as e:
+            return send_error(e.args)
+        return send_success(VideoSerializer(instance=video).data)
+
+
+class IgnoreAcceptNegotiation(BaseContentNegotiation):
+    # Lettori video e tag <img> mandano Accept che non corrispondono ai renderer JSON
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class MediaFileView(APIView):
+    permission_classes = [AllowAny]
+    content_negotiation_class = IgnoreAcceptNegotiation
+
+    def get(self, request, path):
+        access = get_access(request.user, path)
+        if access is None:
+            raise Http404('File not found')
+        readable, public = access
+        if not readable:
+            return send_error('You cannot access this file', 403)
+        return send_file(request, path, default_storage.path(path),
+                         IMMUTABLE_CACHE_CONTROL if public else PRIVATE_CACHE_CONTROL)
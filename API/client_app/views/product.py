@@ -1,20 +1,29 @@
 from rest_framework.decorators import api_view
+from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
-from API.static import send_success, send_error
+from API.static import send_success, send_error, conditional, get_validator
+from API.pagination import CursorPaginator, get_param, page_data
+from client_app.cache import get_product_cards
 from client_app.permissions import SPIDPermission
-from client_app.models import Product, Media, User, Favorite, Order
+from client_app.models import Product, Media, User, Favorite, Order, VideoUpload
 from client_app.permissions import ProductPermission
 from client_app.serializers.media import VideoSerializer
+from client_app.uploads import finalize_upload, UPLOADING, COMPLETED
 from client_app.serializers.product import (
     AddProductSerializer,
-    ProductSerializer,
-    OrderSerializer,
     FavoriteProductSerializer,
     SubmitOfferSerializer,
     AvailabilityDatesSerializer,
-    ResponseOfferSerializer
+    AvailabilityWindowSerializer,
+    ResponseOfferSerializer,
+    mark_favorites,
+    ORDER_STATES,
+    DELIVERY_MODES
 )
 
+product_paginator = CursorPaginator(ordering=('-id',))
+order_paginator = CursorPaginator(ordering=('-id',))
+
 
 def save_product(data, instance=None, status=-1, user=None):
     serializer = AddProductSerializer(data=data)
@@ -35,35 +44,95 @@ def save_product(data, instance=None, status=-1, user=None):
     return send_error(serializer.errors)
 
 
+def send_product_page(products, cursor, limit, user=None):
+    try:
+        page, next_cursor = product_paginator.paginate(products, cursor, limit)
+    except ValueError as e:
+        return send_error(e.args)
+    return send_success(page_data(mark_favorites(get_product_cards(page), user), next_cursor))
+
+
+# Ordini con card del prodotto e riepilogo del richiedente: una query per i prodotti degli ordini e le card in batch
+def serialize_orders(orders):
+    orders = list(orders)
+    products = {}
+    for order_id, product_id in Order.product.through.objects.filter(
+            order_id__in=[item.pk for item in orders]).values_list('order_id', 'product_id'):
+        products.setdefault(order_id, product_id)
+    cards = {card['id']: card for card in get_product_cards(set(products.values()))}
+    return [{
+        'id': item.pk,
+        'product': cards.get(products.get(item.pk)),
+        'user': {'id': item.user_id, 'first_name': item.user.first_name, 'last_name': item.user.last_name},
+        'state': ORDER_STATES[item.state],
+        'price': item.price,
+        'date_start': item.date_start,
+        'date_end': item.date_end,
+        'delivery_mode': DELIVERY_MODES[item.delivery_mode],
+    } for item in orders]
+
+
+def send_order_page(orders, request):
+    try:
+        page, next_cursor = order_paginator.paginate(orders, get_param(request, 'cursor'), get_param(request, 'limit'))
+    except ValueError as e:
+        return send_error(e.args)
+    return send_success(page_data(serialize_orders(page), next_cursor))
+
+
 def get_product(pk, get_data=False):
     try:
         product = Product.objects.get(pk=pk)
     except Product.DoesNotExist:
         return None
-    return product if not get_data else ProductSerializer(instance=product).serialize_data()
+    return product if not get_data else get_product_cards([product])[0]
 
 
 class ProductView(APIView):
     permission_classes = [ProductPermission]
 
     def get(self, request):
+        list_products = Product.objects.filter(status=4)
+        cursor = get_param(request, 'cursor')
+        if cursor is not None:
+            return send_product_page(list_products, cursor, get_param(request, 'limit'), request.user)
         limit = request.data.get('limit')
         start = request.data.get('start')
         if limit is None:
             limit = 50
         if start is None:
             start = 0
-        list_products = Product.objects.all().order_by('-id').filter(status=4)
-        if len(list_products) >= start >= 0:
-            return send_success(
-                [ProductSerializer(instance=item).serialize_data() for item in list_products[start:limit]])
-        return send_error('Start greater than maximum length')
+        if start < 0:
+            return send_error('Start greater than maximum length')
+        data = get_product_cards(list_products.order_by('-id')[start:(start + limit)])
+        if start > 0 and len(data) == 0:
+            return send_error('Start greater than maximum length')
+        return send_success(mark_favorites(data, request.user))
 
     def put(self, request):
         return save_product(request.data, user=request.user)
 
 
+def product_version(request, pk):
+    return get_validator(
+        Product.objects.filter(pk=pk),
+        'updated_at', 'brand__updated_at', 'color__updated_at', 'material__updated_at',
+        'media__image__updated_at', 'media__video__updated_at',
+        counts=['media__image', 'media__video']
+    )
+
+
+def favorites_version(request):
+    return get_validator(
+        Product.objects.filter(favorite__user=request.user),
+        'updated_at', 'brand__updated_at', 'color__updated_at', 'material__updated_at',
+        'media__image__updated_at', 'media__video__updated_at',
+        counts=['pk', 'media__image', 'media__video']
+    )
+
+
 class ProductInfoView(APIView):
+    @conditional(product_version)
     def get(self, request, pk):
         data = get_product(pk, get_data=True)
         if data is None:
@@ -92,7 +161,10 @@ class ProductInfoView(APIView):
 class MyProductView(APIView):
     def get(self, request):
         products = Product.objects.filter(owner=request.user, status__lt=5)
-        return send_success([ProductSerializer(instance=item).serialize_data() for item in products])
+        cursor = get_param(request, 'cursor')
+        if cursor is not None:
+            return send_product_page(products, cursor, get_param(request, 'limit'), request.user)
+        return send_success(mark_favorites(get_product_cards(products), request.user))
 
 
 class UserProductsView(APIView):
@@ -101,8 +173,11 @@ class UserProductsView(APIView):
             user = User.objects.get(pk=pk)
         except User.DoesNotExist:
             return send_error('User not found')
-        products = Product.objects.filter(user=user, status=4)
-        return send_success([ProductSerializer(instance=item).serialize_data() for item in products])
+        products = Product.objects.filter(owner=user, status=4)
+        cursor = get_param(request, 'cursor')
+        if cursor is not None:
+            return send_product_page(products, cursor, get_param(request, 'limit'), request.user)
+        return send_success(mark_favorites(get_product_cards(products), request.user))
 
 
 class SendVerificationProductView(APIView):
@@ -118,6 +193,20 @@ class SendVerificationProductView(APIView):
             return send_error('Product already under review')
         if product.status != 1:
             return send_error('Product are not in preparation status')
+        upload_id = request.data.get('upload_id')
+        if upload_id is not None:
+            # Video già caricato a pezzi (client/media/<pk>/videos/uploads)
+            try:
+                upload = VideoUpload.objects.get(pk=upload_id, media_id=product.media_id, user=request.user)
+                if upload.status == UPLOADING:
+                    finalize_upload(upload)
+                elif upload.status != COMPLETED:
+                    raise ValueError('Upload aborted')
+            except (VideoUpload.DoesNotExist, TypeError, ValueError) as e:
+                return send_error(e.args if isinstance(e, ValueError) else 'Upload not found')
+            product.status = 2
+            product.save()
+            return send_success('Product under review')
         serializer = VideoSerializer(data=request.data)
         if serializer.is_valid():
             media = Media.objects.get(pk=product.media)
@@ -129,12 +218,13 @@ class SendVerificationProductView(APIView):
 
 
 @api_view(['GET'])
+@conditional(favorites_version)
 def get_favorites(request, format=None):
     try:
-        products = Favorite.objects.get(user=request.user).products
+        products = Favorite.objects.get(user=request.user).products.all()
     except Favorite.DoesNotExist:
         return send_success([])
-    return send_success([ProductSerializer(item).serialize_data() for item in products])
+    return send_success([dict(card, is_favorite=True) for card in get_product_cards(products)])
 
 
 class FavoriteView(APIView):
@@ -165,12 +255,23 @@ class AvailabilityDatesView(APIView):
         product = get_product(pk)
         if product is None:
             return send_error('Product not found')
-        serializer = AvailabilityDatesSerializer(data=request.data)
+        serializer = AvailabilityDatesSerializer(data=request.query_params or request.data)
         if serializer.is_valid():
             return send_success(serializer.serialize(product))
         return send_error(serializer.errors)
 
 
+class AvailabilityView(APIView):
+    permission_classes = [AllowAny]
+
+    # Disponibilità di più prodotti in un periodo
+    def post(self, request):
+        serializer = AvailabilityWindowSerializer(data=request.data)
+        if serializer.is_valid():
+            return send_success(serializer.serialize())
+        return send_error(serializer.errors)
+
+
 @api_view(['PUT'])
 def make_offer(request, pk, format=None):
     product = get_product(pk)
@@ -179,7 +280,7 @@ def make_offer(request, pk, format=None):
     serializer = SubmitOfferSerializer(data=request.data)
     if serializer.is_valid():
         try:
-            serializer.save()
+            serializer.save(user=request.user, product=product)
             return send_success('Order submitted')
         except ValueError as e:
             return send_error(e.args)
@@ -193,16 +294,8 @@ class OfferView(APIView):
         product = get_product(pk)
         if product is None:
             return send_error('Product not found')
-        orders = Order.objects.filter(product=product, product__owner=request.user, status=1)
-        data = []
-        for item in orders:
-            data.append({
-                'product': ProductSerializer(instance=product).serialize_data(),
-                'date_start': item.date_start,
-                'date_end': item.date_end,
-                'price': item.price,
-            })
-        return send_success(data)
+        orders = Order.objects.filter(product=product, product__owner=request.user, state=1).select_related('user')
+        return send_success(serialize_orders(orders.order_by('-id')))
 
     def post(self, request, pk):
         product = get_product(pk)
@@ -212,16 +305,42 @@ class OfferView(APIView):
         if serializer.is_valid():
             try:
                 serializer.save(product=product, user=request.user)
-                return send_success('Order accepted')
+                return send_success('Order accepted' if serializer.validated_data['result'] else 'Order rejected')
             except ValueError as e:
                 return send_error(e.args)
         return send_error(serializer.errors)
 
 
+class OfferInboxView(APIView):
+    permission_classes = [SPIDPermission]
+
+    def get(self, request):
+        # Offerte in attesa su tutti i prodotti dell'utente (indice order_lender_state_idx)
+        orders = Order.objects.filter(lender=request.user, state=1).select_related('user')
+        return send_order_page(orders, request)
+
+
+class OrderHistoryView(APIView):
+    def get(self, request):
+        # Ordini dell'utente (indice order_user_id_idx), anche filtrati per stato (order_user_state_idx)
+        orders = Order.objects.filter(user=request.user).select_related('user')
+        state = get_param(request, 'state')
+        if state is not None:
+            try:
+                state = int(state)
+            except (TypeError, ValueError):
+                return send_error('State not valid')
+            if state not in ORDER_STATES:
+                return send_error('State not valid')
+            orders = orders.filter(state=state)
+        return send_order_page(orders, request)
+
+
 @api_view(['GET'])
 def get_cart(request, format=None):
-    orders = Order.objects.get(user=request.user, state=2)
-    return send_success([OrderSerializer(item).serialize_data() for item in orders])
+    # Ordini accettati in attesa di pagamento
+    orders = Order.objects.filter(user=request.user, state=2).select_related('user')
+    return send_order_page(orders, request)
 
 
 class CheckoutView(APIView):
@@ -1,9 +1,11 @@
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from client_app.serializers.search import SearchProductSerializer, SearchUserSerializer
-from client_app.serializers.product import ProductSerializer
+from client_app.cache import get_product_cards, get_search_results
 from client_app.serializers.client import UserSerializer
+from client_app.serializers.product import mark_favorites
 from API.static import send_success, send_error
+from API.pagination import page_data
 
 
 class SearchProductView(APIView):
@@ -12,8 +14,18 @@ class SearchProductView(APIView):
     def post(self, request):
         serializer = SearchProductSerializer(data=request.data)
         if serializer.is_valid():
-            products = serializer.get_filters()
-            return send_success([ProductSerializer(instance=item).serialize_data() for item in products])
+            try:
+                results = get_search_results(serializer.get_query(), serializer.get_results)
+            except ValueError as e:
+                return send_error(e.args)
+            data = mark_favorites(get_product_cards(results['ids']), request.user)
+            if serializer.validated_data.get('cursor') is not None:
+                data = page_data(data, results['next_cursor'])
+            if serializer.validated_data['facets']:
+                # Con i conteggi i risultati vengono restituiti in un oggetto
+                data = data if isinstance(data, dict) else {'results': data}
+                data['facets'] = results['facets']
+            return send_success(data)
         return send_error(serializer.errors)
 
 
@@ -23,6 +35,12 @@ class SearchUserView(APIView):
     def post(self, request):
         serializer = SearchUserSerializer(data=request.data)
         if serializer.is_valid():
-            users = serializer.get_filters()
-            return send_success(UserSerializer(instance=users, many=True).data)
+            try:
+                users = serializer.get_filters()
+            except ValueError as e:
+                return send_error(e.args)
+            data = UserSerializer(instance=users, many=True).data
+            if serializer.validated_data.get('cursor') is not None:
+                data = page_data(data, serializer.next_cursor)
+            return send_success(data)
         return send_error(serializer.errors)
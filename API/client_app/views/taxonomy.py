@@ -0,0 +1,17 @@
+from rest_framework.permissions import AllowAny
+from rest_framework.views import APIView
+from API.static import send_success, conditional
+from client_app.taxonomy import taxonomy
+
+
+def taxonomy_version(request):
+    return taxonomy.snapshot()['etag'], None
+
+
+class TaxonomyView(APIView):
+    permission_classes = [AllowAny]
+
+    # Brand, colori e materiali letti direttamente dal registro in memoria
+    @conditional(taxonomy_version)
+    def get(self, request):
+        return send_success(taxonomy.snapshot()['data'])